@@ -1,16 +1,125 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, make_response, send_file, abort
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
 import json
+import logging
+import atexit
 import base64
+import contextvars
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
 from datetime import datetime
+from channel_index import ChannelIndex
+from durations import DEFAULT_SHORTS_MAX_SECONDS, regular_flags
+from image_cache import ImageCache, THUMBNAIL_SIZES, YTIMG_URL
+from logs import Sampler, setup_logging
+from metrics import Metrics
+from quota import QuotaLedger
+from response_cache import ResponseCache
+from singleflight import SingleFlight, file_lock
+from storage import FavoritesSnapshot, create_store
+from video_cache import VideoCache, PART_FIELDS, fields_from_item, item_from_fields
+from watch_history import DEFAULT_PROFILE, WatchHistory
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'your-secret-key-change-this')
 
 # YouTube API configuration
 YOUTUBE_API_KEY = os.environ.get('YOUTUBE_API_KEY', '')
-YOUTUBE_API_BASE = 'https://www.googleapis.com/youtube/v3'
+YOUTUBE_API_BASE = os.environ.get('YOUTUBE_API_BASE', 'https://www.googleapis.com/youtube/v3')  # point at tools/fake_youtube.py to test
+YOUTUBE_MAX_IDS_PER_CALL = 50  # videos.list accepts up to 50 comma-separated IDs
+# Videos this long or shorter are treated as Shorts and hidden from channel pages
+SHORTS_MAX_SECONDS = int(os.environ.get('SHORTS_MAX_SECONDS', DEFAULT_SHORTS_MAX_SECONDS))
+
+# Daily YouTube Data API budget; optional calls stop once less than QUOTA_RESERVE of it is left
+YOUTUBE_DAILY_QUOTA = int(os.environ.get('YOUTUBE_DAILY_QUOTA', 10000))
+QUOTA_RESERVE = float(os.environ.get('QUOTA_RESERVE', 0.2))
+QUOTA_DB = os.environ.get('QUOTA_DB', 'quota.db')
+
+# Local index of channel videos; favorites re-sync at most once per CHANNEL_SYNC_INTERVAL
+CHANNEL_INDEX_DB = os.environ.get('CHANNEL_INDEX_DB', 'channels.db')
+CHANNEL_SYNC_INTERVAL = int(os.environ.get('CHANNEL_SYNC_INTERVAL', 900))  # seconds
+
+# Pages of token-paged channel listings (playlists tab), so back/forward is a cache hit
+CHANNEL_PAGE_CACHE_TTL = int(os.environ.get('CHANNEL_PAGE_CACHE_TTL', 900))  # seconds
+
+# Cached API responses and precomputed playlist pages, shared through SQLite with other
+# workers and the prefetch worker
+RESPONSE_CACHE_DB = os.environ.get('RESPONSE_CACHE_DB', 'responses.db')
+PLAYLIST_CACHE_TTL = int(os.environ.get('PLAYLIST_CACHE_TTL', 1800))  # seconds
+# Favorites are re-warmed every PREFETCH_INTERVAL seconds; set PREFETCH_IN_PROCESS=0 when
+# running `python worker.py` as its own process instead. Only one process on the box warms at
+# a time, and anything that will still be fresh at the next round is skipped. Keep it below
+# CHANNEL_SYNC_INTERVAL and PLAYLIST_CACHE_TTL so favorites never go stale on the request path.
+PREFETCH_INTERVAL = float(os.environ.get('PREFETCH_INTERVAL', min(CHANNEL_SYNC_INTERVAL, PLAYLIST_CACHE_TTL) / 2))
+PREFETCH_IN_PROCESS = os.environ.get('PREFETCH_IN_PROCESS', '1') == '1'
+
+# Search results cache (search.list costs 100 quota units per call)
+SEARCH_CACHE_SIZE = int(os.environ.get('SEARCH_CACHE_SIZE', 500))
+SEARCH_CACHE_TTL = int(os.environ.get('SEARCH_CACHE_TTL', 3600))  # fresh for an hour
+SEARCH_CACHE_STALE_TTL = int(os.environ.get('SEARCH_CACHE_STALE_TTL', 86400))  # then served stale while refreshing
+
+# Shared HTTP connection pool for YouTube and DigitalOcean calls; keep it at least as large
+# as the request threads per worker (WEB_THREADS, see gunicorn.conf.py) so they don't queue for sockets
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 48))
+HTTP_TIMEOUT = float(os.environ.get('HTTP_TIMEOUT', 10))  # seconds, per connect/read
+HTTP_RETRIES = int(os.environ.get('HTTP_RETRIES', 3))
+
+# videos.list batches for a single lookup (e.g. a 100-video channel sync) run in parallel
+UPSTREAM_WORKERS = int(os.environ.get('UPSTREAM_WORKERS', 8))
+
+# Home page thumbnail lookups run in parallel, bounded by worker count and a per-page deadline
+THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', 8))
+THUMBNAIL_DEADLINE = float(os.environ.get('THUMBNAIL_DEADLINE', 3))  # seconds
+# Resolved thumbnails are batched and written back to favorites (locally, no redeploy)
+THUMBNAIL_SAVE_DELAY = float(os.environ.get('THUMBNAIL_SAVE_DELAY', 30))  # seconds
+THUMBNAIL_REFRESH_INTERVAL = float(os.environ.get('THUMBNAIL_REFRESH_INTERVAL', 6 * 3600))  # 0 disables
+
+# Plays are recorded in the background; bursts within this window become one write
+HISTORY_WRITE_DELAY = float(os.environ.get('HISTORY_WRITE_DELAY', 2))  # seconds
+# Watch history is an append-only log on local disk, seeded once from the favorites store
+# and keeping the last HISTORY_LIMIT videos per profile. HISTORY_PROFILES (comma-separated)
+# are the profiles offered on the home page; the first one's history goes to FAVORITES_DATA.
+HISTORY_LOG = os.environ.get('HISTORY_LOG', 'watch_history.log')
+HISTORY_LIMIT = int(os.environ.get('HISTORY_LIMIT', 50))
+HISTORY_PROFILES = [name.strip() for name in os.environ.get('HISTORY_PROFILES', DEFAULT_PROFILE).split(',')
+                    if name.strip()] or [DEFAULT_PROFILE]
+
+# Video thumbnails are served from a local disk cache (/thumb/<video_id>/<size>) instead of
+# being hot-linked from i.ytimg.com; set IMAGE_PROXY=0 to link to YouTube directly again
+IMAGE_PROXY = os.environ.get('IMAGE_PROXY', '1') == '1'
+IMAGE_CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR', 'image_cache')
+IMAGE_CACHE_MAX_MB = int(os.environ.get('IMAGE_CACHE_MAX_MB', 200))
+IMAGE_MAX_AGE = int(os.environ.get('IMAGE_MAX_AGE', 7 * 86400))  # browser cache lifetime, seconds
+
+# How long browsers may reuse a rendered page before revalidating it (seconds). Revalidation
+# is cheap: an unchanged page is answered with a 304 before the view does any work.
+PAGE_MAX_AGE = {
+    'home': 0,  # Recently watched changes with every video
+    'playlist': 300,
+    'channel': 300,
+    'search': 600,
+}
+
+# Request traces and upstream call metrics (/admin/metrics, and /metrics for Prometheus,
+# which also accepts `Authorization: Bearer $METRICS_TOKEN` so a scraper needn't log in)
+METRICS_RECENT_TRACES = int(os.environ.get('METRICS_RECENT_TRACES', 200))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Log level (DEBUG adds per-request lines); per-video DEBUG lines inside loops are logged
+# one in LOG_SAMPLE_EVERY
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_SAMPLE_EVERY = int(os.environ.get('LOG_SAMPLE_EVERY', 50))
+
+setup_logging(LOG_LEVEL)
+logger = logging.getLogger(__name__)
+sample_item_log = Sampler(LOG_SAMPLE_EVERY)
 
 # Admin password (set via environment variable)
 ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', 'admin123')
@@ -18,49 +127,74 @@ ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', 'admin123')
 # DigitalOcean API configuration (optional - for automatic updates)
 DO_API_TOKEN = os.environ.get('DO_API_TOKEN', '')
 DO_APP_ID = os.environ.get('DO_APP_ID', '')
+DO_API_BASE = os.environ.get('DO_API_BASE', 'https://api.digitalocean.com/v2')  # point at tools/fake_digitalocean.py to test
+# Favorites changes are pushed at most once per window (each push redeploys the app)
+DO_SYNC_WINDOW = float(os.environ.get('DO_SYNC_WINDOW', 60))  # seconds
+# Watch history alone waits much longer; it also rides along with the next favorites push
+HISTORY_SYNC_WINDOW = float(os.environ.get('HISTORY_SYNC_WINDOW', 6 * 3600))  # seconds
+DO_SYNC_MAX_RETRIES = int(os.environ.get('DO_SYNC_MAX_RETRIES', 5))
 
-# File to store favorites and watch history (for local development)
+# File to store favorites (for local development)
 FAVORITES_FILE = 'favorites.json'
 
+# Favorites backend: 'sqlite' (default, seeded once from FAVORITES_DATA / favorites.json) or 'json'
+FAVORITES_BACKEND = os.environ.get('FAVORITES_BACKEND', 'sqlite')
+FAVORITES_DB = os.environ.get('FAVORITES_DB', 'favorites.db')
+# How often (seconds) to check whether another worker changed the favorites
+FAVORITES_CHECK_INTERVAL = float(os.environ.get('FAVORITES_CHECK_INTERVAL', 1))
+
+# Per-video metadata cache (SQLite file shared by all workers on the box)
+VIDEO_CACHE_DB = os.environ.get('VIDEO_CACHE_DB', 'video_cache.db')
+VIDEO_CACHE_MEMORY_ITEMS = int(os.environ.get('VIDEO_CACHE_MEMORY_ITEMS', 5000))
+# Videos kept in the shared SQLite file; the least recently fetched are dropped past this
+VIDEO_CACHE_MAX_VIDEOS = int(os.environ.get('VIDEO_CACHE_MAX_VIDEOS', 50000))
+# Optional per-field TTL overrides in seconds, e.g. VIDEO_CACHE_TTL_EMBEDDABLE=3600
+VIDEO_CACHE_TTLS = {
+    field: int(os.environ[f'VIDEO_CACHE_TTL_{field.upper()}'])
+    for field in ('duration', 'embeddable', 'title', 'channel', 'thumbnail')
+    if os.environ.get(f'VIDEO_CACHE_TTL_{field.upper()}')
+}
+
+favorites_store = create_store(FAVORITES_BACKEND, FAVORITES_DB, FAVORITES_FILE)
+favorites_snapshot = FavoritesSnapshot(favorites_store, FAVORITES_CHECK_INTERVAL)
+
+watch_history = WatchHistory(HISTORY_LOG, limit=HISTORY_LIMIT)
+if not os.path.exists(HISTORY_LOG):
+    watch_history.seed(favorites_store.saved_watch_history(HISTORY_PROFILES[0]))
+
 def load_favorites():
-    """Load favorites and watch history from environment variable or file"""
-    # Try to load from environment variable first (for production)
-    favorites_env = os.environ.get('FAVORITES_DATA')
-    if favorites_env:
-        try:
-            # Decode base64 and parse JSON
-            favorites_json = base64.b64decode(favorites_env).decode('utf-8')
-            return json.loads(favorites_json)
-        except:
-            pass
+    """Load favorites (a shared snapshot - don't modify it in place)"""
+    return favorites_snapshot.get()
+
+def export_favorites():
+    """Favorites as FAVORITES_DATA holds them, with every profile's watch history
     
-    # Fallback to file (for local development)
-    try:
-        with open(FAVORITES_FILE, 'r') as f:
-            return json.load(f)
-    except:
-        # Default favorites if nothing exists
-        return {
-            'playlists': [],
-            'channels': [],
-            'watch_history': []
-        }
+    The first profile's history goes under 'watch_history', as before profiles
+    existed, and the others under 'watch_history_profiles', so all of them
+    survive a redeploy.
+    """
+    favorites = dict(favorites_store.load(), watch_history=watch_history.get(HISTORY_PROFILES[0]))
+    favorites.pop('watch_history_profiles', None)
+    if len(HISTORY_PROFILES) > 1:
+        favorites['watch_history_profiles'] = {profile: watch_history.get(profile) for profile in HISTORY_PROFILES[1:]}
+    return favorites
+
+def encode_favorites(favorites):
+    """Encode favorites the way FAVORITES_DATA stores them"""
+    return base64.b64encode(json.dumps(favorites).encode('utf-8')).decode('utf-8')
 
 def update_digitalocean_env_var(favorites):
     """Update FAVORITES_DATA environment variable in DigitalOcean"""
     if not DO_API_TOKEN or not DO_APP_ID:
         # If no API token/app ID, just print the value for manual update
-        favorites_json = json.dumps(favorites)
-        favorites_b64 = base64.b64encode(favorites_json.encode('utf-8')).decode('utf-8')
-        print(f"\n🔄 FAVORITES_DATA environment variable value:")
-        print(f"FAVORITES_DATA={favorites_b64}")
-        print("💡 Add this to your DigitalOcean app environment variables")
+        favorites_b64 = encode_favorites(favorites)
+        logger.info("🔄 FAVORITES_DATA environment variable value:\nFAVORITES_DATA=%s\n"
+                    "💡 Add this to your DigitalOcean app environment variables", favorites_b64)
         return False
     
     try:
         # Encode favorites for environment variable
-        favorites_json = json.dumps(favorites)
-        favorites_b64 = base64.b64encode(favorites_json.encode('utf-8')).decode('utf-8')
+        favorites_b64 = encode_favorites(favorites)
         
         # Get current app spec
         headers = {
@@ -69,13 +203,22 @@ def update_digitalocean_env_var(favorites):
         }
         
         # Get app spec
-        response = requests.get(f'https://api.digitalocean.com/v2/apps/{DO_APP_ID}', headers=headers)
+        response = youtube.request('GET', f'{DO_API_BASE}/apps/{DO_APP_ID}', headers=headers)
         if response.status_code != 200:
-            print(f"❌ Failed to get app spec: {response.status_code}")
+            logger.error("❌ Failed to get app spec: %s", response.status_code)
             return False
         
         app_spec = response.json()['app']
         
+        # Nothing to do (and no redeploy) if every service already has this value
+        services = app_spec['spec'].get('services', [])
+        if services and all(
+            any(env.get('key') == 'FAVORITES_DATA' and env.get('value') == favorites_b64 for env in service.get('envs', []))
+            for service in services
+        ):
+            logger.info("✅ DigitalOcean environment variable already up to date")
+            return True
+        
         # Update environment variables
         if 'services' in app_spec['spec']:
             for service in app_spec['spec']['services']:
@@ -93,98 +236,202 @@ def update_digitalocean_env_var(favorites):
                 })
         
         # Update the app
-        update_response = requests.put(
-            f'https://api.digitalocean.com/v2/apps/{DO_APP_ID}',
+        update_response = youtube.request(
+            'PUT',
+            f'{DO_API_BASE}/apps/{DO_APP_ID}',
             headers=headers,
             json={'spec': app_spec['spec']}
         )
         
         if update_response.status_code == 200:
-            print("✅ Successfully updated DigitalOcean environment variable")
+            logger.info("✅ Successfully updated DigitalOcean environment variable")
             return True
         else:
-            print(f"❌ Failed to update app: {update_response.status_code}")
+            logger.error("❌ Failed to update app: %s", update_response.status_code)
             return False
             
     except Exception as e:
-        print(f"❌ Error updating DigitalOcean env var: {e}")
+        logger.error("❌ Error updating DigitalOcean env var: %s", e)
         return False
 
-def save_favorites(favorites):
-    """Save favorites and watch history to environment variable and file"""
-    # Save to file (for local development)
-    try:
-        with open(FAVORITES_FILE, 'w') as f:
-            json.dump(favorites, f, indent=2)
-    except Exception as e:
-        print(f"Warning: Could not save to file: {e}")
+class RemoteSync:
+    """Pushes favorites to DigitalOcean at most once per window, and only if they changed
     
-    # Try to update DigitalOcean environment variable automatically
-    update_digitalocean_env_var(favorites)
+    Every push redeploys the app, so changes are batched: the first change starts
+    a window, and when it ends the current favorites are pushed once. A change
+    with a shorter window brings a pending push forward. Failed pushes are
+    retried with exponential backoff.
+    """
     
-    return favorites
-
-def add_to_watch_history(video_id, video_title=None, channel_title=None, thumbnail=None):
-    """Add a video to watch history"""
-    favorites = load_favorites()
+    def __init__(self, window=DO_SYNC_WINDOW, max_retries=DO_SYNC_MAX_RETRIES):
+        self.window = window
+        self.max_retries = max_retries
+        # What DigitalOcean has now, as far as we know
+        self.last_pushed = os.environ.get('FAVORITES_DATA')
+        self._lock = threading.Lock()
+        self._timer = None
+        self._due = None  # when the pending timer fires
+        self._attempt = 0
     
-    # Ensure watch_history exists
-    if 'watch_history' not in favorites:
-        favorites['watch_history'] = []
+    def _start_timer(self, delay):
+        self._timer = threading.Timer(delay, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+        self._due = time.time() + delay
+    
+    def schedule(self, window=None):
+        """Note that favorites changed; they'll be pushed when the window (default self.window) closes"""
+        window = self.window if window is None else window
+        with self._lock:
+            if self._timer is None:
+                self._start_timer(window)
+            elif time.time() + window < self._due:
+                self._timer.cancel()
+                self._start_timer(window)
+    
+    def flush(self):
+        """Push now if favorites differ from what was last pushed"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        
+        favorites = export_favorites()
+        favorites_b64 = encode_favorites(favorites)
+        if favorites_b64 == self.last_pushed:
+            self._attempt = 0
+            return True
+        
+        if update_digitalocean_env_var(favorites):
+            self.last_pushed = favorites_b64
+            self._attempt = 0
+            return True
+        
+        if not DO_API_TOKEN or not DO_APP_ID:
+            # Manual mode: the value was printed, nothing to retry
+            self.last_pushed = favorites_b64
+            return False
+        
+        with self._lock:
+            if self._attempt < self.max_retries and self._timer is None:
+                delay = self.window * (2 ** self._attempt)
+                self._attempt += 1
+                logger.warning("🔁 Retrying DigitalOcean update in %.0fs (attempt %d/%d)",
+                               delay, self._attempt, self.max_retries)
+                self._start_timer(delay)
+            elif self._attempt >= self.max_retries:
+                logger.error("❌ Giving up on DigitalOcean update until favorites change again")
+                self._attempt = 0
+        return False
     
-    # Get video details if not provided
+    def flush_pending(self):
+        """Push now if a change is waiting for its window to close"""
+        if self._timer is not None:
+            self.flush()
+
+remote_sync = RemoteSync()
+atexit.register(remote_sync.flush_pending)
+
+def favorites_changed(sync_remote=True):
+    """Schedule a DigitalOcean push after a granular store update"""
+    if sync_remote:
+        remote_sync.schedule()
+
+def history_changed():
+    """Schedule a DigitalOcean push for watch history, which can wait for HISTORY_SYNC_WINDOW"""
+    remote_sync.schedule(HISTORY_SYNC_WINDOW)
+
+def current_profile():
+    """The watch history profile picked in this browser"""
+    profile = session.get('profile')
+    return profile if profile in HISTORY_PROFILES else HISTORY_PROFILES[0]
+
+def requested_profile():
+    """The ?profile= an admin history view acts on (the first profile if none is given)"""
+    profile = request.args.get('profile', HISTORY_PROFILES[0])
+    if profile not in HISTORY_PROFILES:
+        abort(404)
+    return profile
+
+def watch_item(video_id, video_title=None, channel_title=None, thumbnail=None, watched_at=None):
+    """Build a watch history entry for a video"""
+    # Get video details if not provided (usually a cache hit)
     if not video_title or not channel_title or not thumbnail:
         try:
-            url = f"{YOUTUBE_API_BASE}/videos"
-            params = {
-                'part': 'snippet',
-                'id': video_id,
-                'key': YOUTUBE_API_KEY
-            }
-            
-            response = requests.get(url, params=params)
-            if response.status_code == 200:
-                data = response.json()
-                if data['items']:
-                    snippet = data['items'][0]['snippet']
-                    video_title = video_title or snippet.get('title', 'Unknown Title')
-                    channel_title = channel_title or snippet.get('channelTitle', 'Unknown Channel')
-                    thumbnail = thumbnail or snippet.get('thumbnails', {}).get('medium', {}).get('url', '')
+            video_details = youtube.get_videos_details([video_id], part='snippet').get(video_id)
+            if video_details:
+                snippet = video_details['snippet']
+                video_title = video_title or snippet.get('title', 'Unknown Title')
+                channel_title = channel_title or snippet.get('channelTitle', 'Unknown Channel')
+                thumbnail = thumbnail or snippet.get('thumbnails', {}).get('medium', {}).get('url', '')
         except Exception as e:
-            print(f"Error fetching video details: {e}")
+            logger.warning("Error fetching video details for %s: %s", video_id, e)
             video_title = video_title or 'Unknown Title'
             channel_title = channel_title or 'Unknown Channel'
             thumbnail = thumbnail or ''
     
-    # Remove if already exists (to avoid duplicates and update timestamp)
-    favorites['watch_history'] = [item for item in favorites['watch_history'] if item['id'] != video_id]
-    
-    # Add to beginning of list
-    watch_item = {
+    return {
         'id': video_id,
         'title': video_title,
         'channel': channel_title,
         'thumbnail': thumbnail,
         'description': '',  # We'll keep this empty for watch history
-        'watched_at': datetime.now().isoformat()
+        'watched_at': watched_at or datetime.now().isoformat()
     }
+
+class HistoryWriter:
+    """Records plays off the request path, coalescing bursts into one write"""
     
-    favorites['watch_history'].insert(0, watch_item)
+    def __init__(self, delay=HISTORY_WRITE_DELAY):
+        self.delay = delay
+        self._pending = {}  # (profile, video_id) -> watched_at of the latest play
+        self._lock = threading.Lock()
+        self._timer = None
     
-    # Keep only last 50 videos
-    favorites['watch_history'] = favorites['watch_history'][:50]
+    def queue(self, video_id, profile):
+        """Remember a play now; it's written at the end of the current window"""
+        with self._lock:
+            self._pending.pop((profile, video_id), None)
+            self._pending[(profile, video_id)] = datetime.now().isoformat()
+            if self._timer is None:
+                self._timer = threading.Timer(self.delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
     
-    # Save updated favorites
-    save_favorites(favorites)
-    print(f"✅ Added to watch history: {video_title}")
+    def flush(self):
+        """Write all pending plays now"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        
+        if not pending:
+            return
+        
+        # Fetch titles for the whole batch in one call, watch_item's lookups then hit the cache.
+        # If it fails the plays are still recorded, each falling back to its own lookup.
+        try:
+            youtube.get_videos_details(list({video_id for _, video_id in pending}), part='snippet')
+        except Exception as e:
+            logger.warning("Error fetching video details for %d plays: %s", len(pending), e)
+        
+        try:
+            # Oldest first, so the latest play ends up at the front; one append to the log for all
+            entries = [(profile, watch_item(video_id, watched_at=watched_at))
+                       for (profile, video_id), watched_at in pending.items()]
+            watch_history.add_many(entries)
+            history_changed()
+            logger.debug("✅ Added %d plays to watch history", len(entries))
+        except Exception as e:
+            logger.exception("Error writing watch history: %s", e)
 
-def get_recent_videos():
-    """Get recently watched videos"""
-    favorites = load_favorites()
-    watch_history = favorites.get('watch_history', [])
-    
-    # Return last 12 watched videos
-    return watch_history[:12]
+history_writer = HistoryWriter()
+atexit.register(history_writer.flush)
+
+def get_recent_videos(profile, limit=None):
+    """Get recently watched videos, most recent first"""
+    return watch_history.get(profile, limit=limit)
 
 def get_youtube_info(url):
     """Extract channel or playlist info from YouTube URL"""
@@ -209,7 +456,7 @@ def fetch_playlist_info(playlist_id):
         'key': YOUTUBE_API_KEY
     }
     
-    response = requests.get(url, params=params)
+    response = youtube.request('GET', url, params=params)
     if response.status_code == 200:
         data = response.json()
         if data['items']:
@@ -233,7 +480,7 @@ def fetch_channel_info_by_username(username):
         'key': YOUTUBE_API_KEY
     }
     
-    response = requests.get(url, params=params)
+    response = youtube.request('GET', url, params=params)
     if response.status_code == 200:
         data = response.json()
         if data['items']:
@@ -250,7 +497,7 @@ def fetch_channel_info_by_username(username):
         'key': YOUTUBE_API_KEY
     }
     
-    response = requests.get(url, params=params)
+    response = youtube.request('GET', url, params=params)
     if response.status_code == 200:
         data = response.json()
         if data['items']:
@@ -273,7 +520,7 @@ def fetch_channel_info(channel_id):
         'key': YOUTUBE_API_KEY
     }
     
-    response = requests.get(url, params=params)
+    response = youtube.request('GET', url, params=params)
     if response.status_code == 200:
         data = response.json()
         if data['items']:
@@ -286,12 +533,135 @@ def fetch_channel_info(channel_id):
             }, None
     return None, "Could not fetch channel info"
 
+# Which view is making upstream calls, for quota accounting
+current_route = contextvars.ContextVar('current_route', default='background')
+metrics = Metrics(recent_traces=METRICS_RECENT_TRACES)
+
+@app.before_request
+def track_route():
+    current_route.set(request.endpoint or 'unknown')
+    metrics.start_request(request.endpoint or 'unknown')
+
+@app.after_request
+def finish_trace(response):
+    metrics.finish_request(response.status_code)
+    return response
+
+@app.teardown_request
+def close_trace(error=None):
+    # Requests that raised never reach after_request
+    metrics.finish_request(500)
+
+def quota_exhausted_response():
+    """Stand-in response for calls we skip because the day's quota is spent"""
+    response = requests.Response()
+    response.status_code = 429
+    response._content = b'{"error": {"message": "Daily YouTube quota budget used up"}}'
+    return response
+
+def create_http_session(pool_size=HTTP_POOL_SIZE, retries=HTTP_RETRIES):
+    """Create a pooled keep-alive session that retries 429/5xx with backoff"""
+    retry = Retry(
+        total=retries,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET', 'PUT']),
+        respect_retry_after_header=True,
+        raise_on_status=False  # Hand the last response back so callers can check status_code
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+    
+    http = requests.Session()
+    http.mount('https://', adapter)
+    http.mount('http://', adapter)
+    return http
+
+def normalize_query(query):
+    """Normalize a search query so trivially different spellings share a cache entry"""
+    return ' '.join(unicodedata.normalize('NFKC', query).casefold().split())
+
 class YouTubeAPI:
-    def __init__(self, api_key):
+    def __init__(self, api_key, cache=None, http=None, timeout=HTTP_TIMEOUT, search_cache=None, quota=None,
+                 uploads_cache=None, shorts_max_seconds=SHORTS_MAX_SECONDS, executor=None, metrics=None):
         self.api_key = api_key
+        self.metrics = metrics
+        self.executor = executor
+        self.flights = SingleFlight()
+        self.shorts_max_seconds = shorts_max_seconds
+        self.cache = cache
+        self.search_cache = search_cache
+        self.uploads_cache = uploads_cache
+        self.quota = quota
+        self.http = http or create_http_session()
+        self.timeout = timeout
+    
+    def request(self, method, url, **kwargs):
+        """Send a request through the shared connection pool, charging YouTube calls to the quota"""
+        kwargs.setdefault('timeout', self.timeout)
+        
+        endpoint = url[len(YOUTUBE_API_BASE) + 1:] if url.startswith(YOUTUBE_API_BASE) else None
+        if endpoint and self.quota and not self.quota.allow(endpoint):
+            logger.warning("⛽ Skipping %s call, daily quota budget is used up", endpoint)
+            return quota_exhausted_response()
+        
+        def send():
+            if endpoint and self.quota:
+                self.quota.record(endpoint, current_route.get())
+            started = time.perf_counter()
+            status = 'error'
+            try:
+                response = self.http.request(method, url, **kwargs)
+                status = response.status_code
+            finally:
+                if self.metrics:
+                    self.record_call(method, url, endpoint, kwargs.get('params') or {},
+                                     time.perf_counter() - started, status)
+            if endpoint and self.quota and response.status_code == 403 and 'quotaExceeded' in response.text:
+                self.quota.mark_exhausted()
+            return response
+        
+        if endpoint and method == 'GET':
+            # Identical concurrent reads share one upstream call (and one quota charge)
+            key = (url, tuple(sorted(kwargs.get('params', {}).items())))
+            return self.flights.do(key, send)
+        return send()
+    
+    def record_call(self, method, url, endpoint, params, seconds, status):
+        """Add an upstream call to the metrics (and the current request's trace)"""
+        if endpoint:
+            service = 'youtube'
+            items = len(params['id'].split(',')) if 'id' in params else params.get('maxResults')
+            units = self.quota.cost(endpoint) if self.quota else 0
+        else:
+            service = 'digitalocean' if url.startswith(DO_API_BASE) else 'http'
+            path = url.split('://', 1)[-1].split('/')
+            endpoint = f"{method} {path[2] if service == 'digitalocean' and len(path) > 2 else path[0]}"
+            items = units = None
+        self.metrics.record_call(service, endpoint, current_route.get(), seconds, status,
+                                 parts=params.get('part'), items=items, units=units)
+    
+    def can_afford(self, endpoint, optional=False):
+        """Whether the quota budget allows a call (optional calls keep the reserve free)"""
+        return self.quota is None or self.quota.allow(endpoint, optional=optional)
     
     def search_videos(self, query, max_results=20):
-        """Search for videos with safe search enabled"""
+        """Search for videos with safe search enabled (cached, stale results refresh in the background)"""
+        if self.search_cache is None:
+            return self._search_videos(normalize_query(query), max_results)
+        
+        key = self.search_key(query, max_results)
+        query = key[1]
+        if not self.can_afford('search'):
+            # Out of budget: serve whatever we still have cached, however old
+            return self.search_cache.get(key)[0]
+        return self.search_cache.get_or_fetch(key, lambda: self._search_videos(query, max_results),
+                                              allow_refresh=self.can_afford('search', optional=True))
+    
+    def search_key(self, query, max_results=20):
+        """Search cache key; equivalent spellings of a query share one entry"""
+        return ('search', normalize_query(query), 'strict', max_results)
+    
+    def _search_videos(self, query, max_results):
         url = f"{YOUTUBE_API_BASE}/search"
         params = {
             'part': 'snippet',
@@ -302,29 +672,20 @@ class YouTubeAPI:
             'key': self.api_key
         }
         
-        response = requests.get(url, params=params)
+        response = self.request('GET', url, params=params)
         if response.status_code == 200:
             return response.json()
         return None
     
     def check_video_embeddable(self, video_id):
         """Check if a video can be embedded"""
-        url = f"{YOUTUBE_API_BASE}/videos"
-        params = {
-            'part': 'status',
-            'id': video_id,
-            'key': self.api_key
-        }
-        
-        response = requests.get(url, params=params)
-        if response.status_code == 200:
-            data = response.json()
-            if data['items']:
-                return data['items'][0]['status'].get('embeddable', False)
+        video_details = self.get_videos_details([video_id], part='status').get(video_id)
+        if video_details:
+            return video_details['status'].get('embeddable', False)
         return False
 
     def get_playlist_thumbnail(self, playlist_id):
-        """Get thumbnail from first video in playlist"""
+        """Get thumbnail from first video in playlist ('' if it has none, None if the lookup failed)"""
         url = f"{YOUTUBE_API_BASE}/playlistItems"
         params = {
             'part': 'snippet',
@@ -333,7 +694,7 @@ class YouTubeAPI:
             'key': self.api_key
         }
         
-        response = requests.get(url, params=params)
+        response = self.request('GET', url, params=params)
         if response.status_code == 200:
             data = response.json()
             if data.get('items') and len(data['items']) > 0:
@@ -346,53 +707,32 @@ class YouTubeAPI:
                     return thumbnails['default']['url']
                 elif 'high' in thumbnails:
                     return thumbnails['high']['url']
+            return ''
+        if response.status_code == 404:
+            return ''  # Private or deleted playlist
         return None
 
     def get_channel_thumbnail(self, channel_id):
-        """Get thumbnail from first regular video in channel (not shorts)"""
-        url = f"{YOUTUBE_API_BASE}/search"
-        params = {
-            'part': 'snippet',
-            'channelId': channel_id,
-            'type': 'video',
-            'order': 'relevance',
-            'videoDuration': 'medium',  # Filter out shorts
-            'maxResults': 5,  # Get a few videos to find a good one
-            'key': self.api_key
-        }
+        """Get thumbnail from the most recent regular video in channel (not shorts)
         
-        response = requests.get(url, params=params)
-        if response.status_code == 200:
-            data = response.json()
-            if data.get('items'):
-                # Try to find a video that's definitely not a short
-                for item in data['items']:
-                    if 'id' in item and 'videoId' in item['id']:
-                        video_id = item['id']['videoId']
-                        
-                        # Check if it's a regular video (not short)
-                        video_details = self.get_video_details(video_id)
-                        if video_details and self.is_regular_video(video_details):
-                            thumbnails = item['snippet'].get('thumbnails', {})
-                            # Try different thumbnail sizes, prefer medium
-                            if 'medium' in thumbnails:
-                                return thumbnails['medium']['url']
-                            elif 'default' in thumbnails:
-                                return thumbnails['default']['url']
-                            elif 'high' in thumbnails:
-                                return thumbnails['high']['url']
-                
-                # Fallback: if no regular videos found, use first available
-                if data['items']:
-                    item = data['items'][0]
-                    thumbnails = item['snippet'].get('thumbnails', {})
-                    if 'medium' in thumbnails:
-                        return thumbnails['medium']['url']
-                    elif 'default' in thumbnails:
-                        return thumbnails['default']['url']
-                    elif 'high' in thumbnails:
-                        return thumbnails['high']['url']
-        return None
+        Returns '' if the channel has no usable uploads, None if the lookup failed.
+        """
+        data = self.get_channel_uploads(channel_id, max_results=10)
+        if data is None:
+            return None
+        if data['items']:
+            # Try to find a video that's definitely not a short, else use the first available
+            regular_items = self._filter_shorts(data['items'])
+            item = regular_items[0] if regular_items else data['items'][0]
+            thumbnails = item['snippet'].get('thumbnails', {})
+            # Try different thumbnail sizes, prefer medium
+            if 'medium' in thumbnails:
+                return thumbnails['medium']['url']
+            elif 'default' in thumbnails:
+                return thumbnails['default']['url']
+            elif 'high' in thumbnails:
+                return thumbnails['high']['url']
+        return ''
 
     def get_playlist_videos(self, playlist_id, max_results=50):
         """Get videos from a playlist"""
@@ -404,12 +744,12 @@ class YouTubeAPI:
             'key': self.api_key
         }
         
-        response = requests.get(url, params=params)
+        response = self.request('GET', url, params=params)
         if response.status_code == 200:
             return response.json()
         return None
     
-    def get_channel_playlists(self, channel_id, max_results=50):
+    def get_channel_playlists(self, channel_id, max_results=50, page_token=None):
         """Get playlists from a channel"""
         url = f"{YOUTUBE_API_BASE}/playlists"
         params = {
@@ -419,49 +759,96 @@ class YouTubeAPI:
             'key': self.api_key
         }
         
-        response = requests.get(url, params=params)
+        if page_token:
+            params['pageToken'] = page_token
+        
+        response = self.request('GET', url, params=params)
         if response.status_code == 200:
             return response.json()
         return None
 
-    def get_channel_videos_recent_fast(self, channel_id, max_results=20, page_token=None):
-        """Get recent videos from a channel (optimized for speed, filters out shorts)"""
-        url = f"{YOUTUBE_API_BASE}/search"
+    def get_channel_uploads_playlist(self, channel_id):
+        """Get the ID of the playlist holding all of a channel's uploads (cached, it never changes)"""
+        def fetch():
+            url = f"{YOUTUBE_API_BASE}/channels"
+            params = {
+                'part': 'contentDetails',
+                'id': channel_id,
+                'key': self.api_key
+            }
+            
+            response = self.request('GET', url, params=params)
+            if response.status_code == 200:
+                data = response.json()
+                if data.get('items'):
+                    return data['items'][0]['contentDetails']['relatedPlaylists'].get('uploads')
+            return None
+        
+        if self.uploads_cache is None:
+            return fetch()
+        return self.uploads_cache.get_or_fetch(('uploads', channel_id), fetch)
+    
+    def get_channel_uploads(self, channel_id, max_results=50, page_token=None):
+        """Get one page of a channel's uploads (newest first) from its uploads playlist
+        
+        playlistItems.list costs 1 quota unit where search.list costs 100. Items are
+        reshaped like search results ({'id': {'videoId': ...}, 'snippet': ...}) so
+        callers can treat both the same way.
+        """
+        uploads_playlist_id = self.get_channel_uploads_playlist(channel_id)
+        if not uploads_playlist_id:
+            return None
+        
+        url = f"{YOUTUBE_API_BASE}/playlistItems"
         params = {
             'part': 'snippet',
-            'channelId': channel_id,
-            'type': 'video',
-            'order': 'date',
-            'videoDuration': 'medium',  # This filters out shorts (which are 'short')
-            'maxResults': max_results,
+            'playlistId': uploads_playlist_id,
+            'maxResults': min(max_results, 50),
             'key': self.api_key
         }
         
         if page_token:
             params['pageToken'] = page_token
         
-        response = requests.get(url, params=params)
-        if response.status_code == 200:
-            data = response.json()
-            
-            # Additional filtering for shorts by checking duration
-            if data.get('items'):
-                filtered_items = []
-                for item in data['items']:
-                    if ('snippet' in item and 'id' in item and 'videoId' in item['id']):
-                        video_id = item['id']['videoId']
-                        
-                        # Get video details to double-check duration
-                        video_details = self.get_video_details(video_id)
-                        if video_details and self.is_regular_video(video_details):
-                            filtered_items.append(item)
-                        else:
-                            print(f"🚫 Filtered out short video: {item['snippet']['title']}")
-                
-                data['items'] = filtered_items
-            
-            return data
-        return None
+        response = self.request('GET', url, params=params)
+        if response.status_code != 200:
+            return None
+        
+        data = response.json()
+        data['items'] = [
+            {
+                'kind': 'youtube#searchResult',
+                'id': {'kind': 'youtube#video', 'videoId': item['snippet']['resourceId']['videoId']},
+                'snippet': item['snippet']
+            }
+            for item in data.get('items', [])
+            if 'videoId' in item.get('snippet', {}).get('resourceId', {})
+            and item['snippet'].get('title') not in ('Deleted video', 'Private video')
+        ]
+        return data
+    
+    def _filter_shorts(self, items):
+        """Drop shorts from search-shaped items, checking all durations in one batched call"""
+        details_by_id = self.get_videos_details(item['id']['videoId'] for item in items)
+        
+        details_list = [details_by_id.get(item['id']['videoId']) for item in items]
+        
+        filtered_items = []
+        for item, video_details, regular in zip(items, details_list, self.regular_flags(details_list)):
+            if video_details and regular:
+                filtered_items.append(item)
+            elif logger.isEnabledFor(logging.DEBUG) and sample_item_log():
+                logger.debug("🚫 Filtered out short video: %s", item['snippet']['title'])
+        return filtered_items
+
+    def get_channel_videos_recent_fast(self, channel_id, max_results=20, page_token=None):
+        """Get one page of recent videos from a channel (filters out shorts)"""
+        data = self.get_channel_uploads(channel_id, max_results, page_token)
+        if data is None:
+            return None
+        
+        data['items'] = self._filter_shorts(data['items'])
+        return data
 
     def get_channel_videos_recent(self, channel_id, max_results=50):
         """Get recent videos from a channel (most recent first, no shorts)"""
@@ -469,38 +856,11 @@ class YouTubeAPI:
         next_page_token = None
         
         while len(all_videos) < max_results:
-            url = f"{YOUTUBE_API_BASE}/search"
-            params = {
-                'part': 'snippet',
-                'channelId': channel_id,
-                'type': 'video',
-                'order': 'date',  # Most recent first
-                'maxResults': 50,
-                'key': self.api_key
-            }
-            
-            if next_page_token:
-                params['pageToken'] = next_page_token
-            
-            response = requests.get(url, params=params)
-            if response.status_code != 200:
-                break
-                
-            data = response.json()
-            if not data.get('items'):
+            data = self.get_channel_uploads(channel_id, page_token=next_page_token)
+            if not data or not data['items']:
                 break
             
-            # Filter out shorts by checking video duration
-            for item in data['items']:
-                if len(all_videos) >= max_results:
-                    break
-                    
-                video_id = item['id']['videoId']
-                
-                # Get video details to check duration
-                video_details = self.get_video_details(video_id)
-                if video_details and self.is_regular_video(video_details):
-                    all_videos.append(item)
+            all_videos.extend(self._filter_shorts(data['items']))
             
             next_page_token = data.get('nextPageToken')
             if not next_page_token:
@@ -510,146 +870,501 @@ class YouTubeAPI:
 
     def get_channel_videos_comprehensive(self, channel_id):
         """Get comprehensive list of channel videos, filtering out shorts"""
-        all_videos = []
-        next_page_token = None
-        
-        while len(all_videos) < 100:  # Limit to prevent too many API calls
-            url = f"{YOUTUBE_API_BASE}/search"
-            params = {
-                'part': 'snippet',
-                'channelId': channel_id,
-                'type': 'video',
-                'order': 'relevance',
-                'maxResults': 50,
-                'key': self.api_key
-            }
-            
-            if next_page_token:
-                params['pageToken'] = next_page_token
-            
-            response = requests.get(url, params=params)
-            if response.status_code != 200:
-                break
-                
-            data = response.json()
-            if not data.get('items'):
-                break
-            
-            # Filter out shorts by checking video duration
-            for item in data['items']:
-                video_id = item['id']['videoId']
-                
-                # Get video details to check duration
-                video_details = self.get_video_details(video_id)
-                if video_details and self.is_regular_video(video_details):
-                    all_videos.append(item)
-            
-            next_page_token = data.get('nextPageToken')
-            if not next_page_token:
-                break
-        
-        return {'items': all_videos}
+        # Limit to prevent too many API calls
+        return self.get_channel_videos_recent(channel_id, max_results=100)
     
     def get_video_details(self, video_id):
         """Get detailed video info including duration"""
+        return self.get_videos_details([video_id]).get(video_id)
+    
+    def get_videos_details(self, video_ids, part='contentDetails'):
+        """Get video details for many videos at once, keyed by video ID
+        
+        IDs are sent comma-joined in batches of up to 50 per videos.list call.
+        Videos YouTube doesn't return (deleted, private) are absent from the result.
+        Fresh entries in the video cache are served without an API call.
+        """
+        # Dedupe while keeping order
+        video_ids = [video_id for video_id in dict.fromkeys(video_ids) if video_id]
+        details = {}
+        
+        if self.cache:
+            parts = part.split(',')
+            fields = [field for p in parts for field in PART_FIELDS.get(p, ())]
+            if fields and all(p in PART_FIELDS for p in parts):
+                for video_id, cached in self.cache.get_many(video_ids, fields).items():
+                    details[video_id] = item_from_fields(video_id, cached, parts)
+                video_ids = [video_id for video_id in video_ids if video_id not in details]
+                if self.metrics:
+                    self.metrics.record_cache('videos', 'hit', len(details))
+                    self.metrics.record_cache('videos', 'miss', len(video_ids))
+        
+        batches = [video_ids[start:start + YOUTUBE_MAX_IDS_PER_CALL]
+                   for start in range(0, len(video_ids), YOUTUBE_MAX_IDS_PER_CALL)]
+        if len(batches) > 1 and self.executor:
+            # Overlap the calls; each runs in a copy of our context so quota is charged to this route
+            futures = [self.executor.submit(contextvars.copy_context().run, self._fetch_videos_batch, batch, part)
+                       for batch in batches]
+            fetched = [future.result() for future in futures]
+        else:
+            fetched = [self._fetch_videos_batch(batch, part) for batch in batches]
+        
+        items = [item for batch_items in fetched for item in batch_items]
+        for item in items:
+            details[item['id']] = item
+        if self.cache and items:
+            self.cache.set_many({item['id']: fields_from_item(item) for item in items})
+        
+        return details
+    
+    def _fetch_videos_batch(self, video_ids, part):
+        """One videos.list call for up to 50 IDs; returns its items ([] on failure)"""
         url = f"{YOUTUBE_API_BASE}/videos"
         params = {
-            'part': 'contentDetails',
-            'id': video_id,
+            'part': part,
+            'id': ','.join(video_ids),
+            'maxResults': len(video_ids),
             'key': self.api_key
         }
         
-        response = requests.get(url, params=params)
+        response = self.request('GET', url, params=params)
         if response.status_code == 200:
-            data = response.json()
-            return data.get('items', [{}])[0] if data.get('items') else None
-        return None
+            return response.json().get('items', [])
+        return []
     
     def is_regular_video(self, video_details):
         """Check if video is a regular video (not a short)"""
-        duration = video_details.get('contentDetails', {}).get('duration', '')
-        
-        # Parse ISO 8601 duration (PT1M30S = 1 minute 30 seconds)
-        import re
-        
-        # Handle different duration formats
-        if duration.startswith('PT'):
-            # Extract hours, minutes, and seconds
-            hours_match = re.search(r'(\d+)H', duration)
-            minutes_match = re.search(r'(\d+)M', duration)
-            seconds_match = re.search(r'(\d+)S', duration)
-            
-            hours = int(hours_match.group(1)) if hours_match else 0
-            minutes = int(minutes_match.group(1)) if minutes_match else 0
-            seconds = int(seconds_match.group(1)) if seconds_match else 0
-            
-            total_seconds = hours * 3600 + minutes * 60 + seconds
-            
-            # YouTube Shorts are typically 60 seconds or less
-            # We'll be conservative and consider anything over 65 seconds as regular video
-            is_regular = total_seconds > 65
-            
-            if not is_regular:
-                print(f"🚫 Detected short video: {total_seconds} seconds")
-            
-            return is_regular
-        
-        return True  # Default to including if duration can't be parsed
+        return self.regular_flags([video_details])[0]
+
+    def regular_flags(self, details_list):
+        """Classify a batch of videos.list items: True for regular videos, False for shorts"""
+        return regular_flags(details_list, self.shorts_max_seconds)
 
     def get_channel_videos(self, channel_id, max_results=50):
         """Get all videos from a channel (excluding shorts)"""
-        url = f"{YOUTUBE_API_BASE}/search"
-        params = {
-            'part': 'snippet',
-            'channelId': channel_id,
-            'type': 'video',
-            'order': 'relevance',  # Changed from 'date' to 'relevance' to get better mix
-            'videoDuration': 'medium',  # Filters out shorts (which are usually 'short')
-            'maxResults': max_results,
-            'key': self.api_key
-        }
-        
-        response = requests.get(url, params=params)
-        if response.status_code == 200:
-            return response.json()
-        return None
+        return self.get_channel_videos_recent_fast(channel_id, max_results)
 
 # Initialize YouTube API
-youtube = YouTubeAPI(YOUTUBE_API_KEY)
+upstream_executor = ThreadPoolExecutor(max_workers=UPSTREAM_WORKERS, thread_name_prefix='youtube')
+youtube = YouTubeAPI(YOUTUBE_API_KEY,
+                     cache=VideoCache(VIDEO_CACHE_DB, VIDEO_CACHE_MEMORY_ITEMS, VIDEO_CACHE_TTLS,
+                                      max_videos=VIDEO_CACHE_MAX_VIDEOS),
+                     search_cache=ResponseCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL, SEARCH_CACHE_STALE_TTL, name='search',
+                                                db_path=RESPONSE_CACHE_DB, metrics=metrics),
+                     quota=QuotaLedger(QUOTA_DB, YOUTUBE_DAILY_QUOTA, QUOTA_RESERVE),
+                     uploads_cache=ResponseCache(5000, ttl=30 * 86400, stale_ttl=0, name='uploads',
+                                                 db_path=RESPONSE_CACHE_DB, metrics=metrics),
+                     executor=upstream_executor,
+                     metrics=metrics)
+
+channel_index = ChannelIndex(CHANNEL_INDEX_DB, youtube, sync_interval=CHANNEL_SYNC_INTERVAL)
+channel_page_cache = ResponseCache(1000, ttl=CHANNEL_PAGE_CACHE_TTL, stale_ttl=3600, name='channel-pages',
+                                   db_path=RESPONSE_CACHE_DB, metrics=metrics)
+
+def get_channel_playlists_page(channel_id, page):
+    """Get one page of a channel's playlists, going straight to it via recorded page tokens
+    
+    Pages we don't have a token for yet are reached by walking forward from the
+    last one we do, recording tokens on the way.
+    """
+    def fetch_page(page_number, page_token):
+        def fetch():
+            results = youtube.get_channel_playlists(channel_id, page_token=page_token)
+            if results and results.get('nextPageToken'):
+                channel_index.record_page_token(channel_id, 'playlists', page_number + 1, results['nextPageToken'])
+            return results
+        return fetch
+    
+    # Walk forward from the closest page we can reach directly
+    start = min(page, channel_index.known_pages(channel_id, 'playlists'))
+    for page_number in range(start, page + 1):
+        page_token = channel_index.page_token(channel_id, 'playlists', page_number) if page_number > 1 else None
+        if page_number > 1 and page_token is None:
+            return None, False  # Past the last page
+        results = channel_page_cache.get_or_fetch(('playlists', channel_id, page_number),
+                                                  fetch_page(page_number, page_token))
+        if results is None:
+            return None, False
+    
+    # Prefetch the next page so "Next" is instant
+    next_token = results.get('nextPageToken')
+    if next_token and youtube.can_afford('playlists', optional=True):
+        next_key = ('playlists', channel_id, page + 1)
+        if channel_page_cache.get(next_key)[0] is None:
+            channel_page_cache.refresh_in_background(next_key, fetch_page(page + 1, next_token))
+    
+    return results, bool(next_token)
+
+playlist_cache = ResponseCache(1000, ttl=PLAYLIST_CACHE_TTL, stale_ttl=86400, name='playlists',
+                               db_path=RESPONSE_CACHE_DB, metrics=metrics)
+
+def build_playlist_videos(playlist_id):
+    """Build the list of embeddable videos the playlist page shows (None if YouTube failed)"""
+    results = youtube.get_playlist_videos(playlist_id)
+    if not results or 'items' not in results:
+        return None
+    
+    videos = []
+    
+    # Resolve embeddability (and durations, for the cache) for the whole page in one pass
+    video_ids = [item['snippet']['resourceId']['videoId'] for item in results['items']
+                 if 'snippet' in item and 'videoId' in item['snippet'].get('resourceId', {})]
+    details_by_id = youtube.get_videos_details(video_ids, part='status,contentDetails,snippet')
+    
+    for item in results['items']:
+        # Check if this is a valid video item
+        if ('snippet' in item and 
+            'resourceId' in item['snippet'] and 
+            'videoId' in item['snippet']['resourceId']):
+            
+            video_id = item['snippet']['resourceId']['videoId']
+            
+            # Skip deleted or private videos
+            if video_id and item['snippet']['title'] != 'Deleted video':
+                # Check if video is embeddable
+                video_details = details_by_id.get(video_id)
+                if video_details and video_details['status'].get('embeddable', False):
+                    video = {
+                        'id': video_id,
+                        'title': item['snippet']['title'],
+                        'channel': item['snippet'].get('channelTitle', 'Unknown Channel'),
+                        'thumbnail': item['snippet']['thumbnails']['medium']['url'] if 'thumbnails' in item['snippet'] else '',
+                        'description': item['snippet']['description'][:100] + '...' if len(item['snippet']['description']) > 100 else item['snippet']['description']
+                    }
+                    videos.append(video)
+                elif logger.isEnabledFor(logging.DEBUG) and sample_item_log():
+                    logger.debug("⚠️ Skipping non-embeddable video: %s - %s", video_id, item['snippet']['title'])
+    
+    return videos
+
+def warm_favorites(ahead=0):
+    """Precompute what playlist() and channel() render for every favorite
+    
+    Every web worker (and worker.py) may run this; the first one to get here
+    does the work and the others skip this round. Anything that will still be
+    fresh `ahead` seconds from now is left alone.
+    """
+    with file_lock(playlist_cache.lock_dir, 'warm-favorites', timeout=0) as acquired:
+        if not acquired:
+            logger.debug("🔥 Another process is warming favorites, skipping")
+            return
+        _warm_favorites(ahead)
+
+def _warm_favorites(ahead):
+    favorites = load_favorites()
+    warmed_playlists = warmed_channels = fresh = 0
+    
+    for playlist in favorites['playlists']:
+        if playlist_cache.fresh_version(('playlist', playlist['id']), ahead=ahead) is not None:
+            fresh += 1
+            continue
+        if not youtube.can_afford('playlistItems', optional=True):
+            break
+        videos = build_playlist_videos(playlist['id'])
+        if videos is not None:
+            playlist_cache.set(('playlist', playlist['id']), videos)
+            warmed_playlists += 1
+    
+    for channel in favorites['channels']:
+        if not youtube.can_afford('playlistItems', optional=True):
+            break
+        # Picks up new uploads and makes sure the first page is indexed
+        channel_index.sync(channel['id'], ahead=ahead)
+        channel_index.get_page(channel['id'], 1)
+        warmed_channels += 1
+    
+    skipped = len(favorites['playlists']) + len(favorites['channels']) - warmed_playlists - warmed_channels - fresh
+    logger.info("🔥 Warmed %d playlists and %d channels%s%s", warmed_playlists, warmed_channels,
+                f", {fresh} playlists still fresh" if fresh else "", f" ({skipped} skipped)" if skipped else "")
+
+def run_prefetch_worker(interval=PREFETCH_INTERVAL):
+    """Warm favorites forever, every interval seconds"""
+    while True:
+        try:
+            # Refresh whatever would go stale before the next round
+            warm_favorites(ahead=interval)
+        except Exception as e:
+            logger.exception("Error warming favorites: %s", e)
+        time.sleep(interval)
+
+def start_prefetch_worker(interval=PREFETCH_INTERVAL):
+    """Run the prefetch worker in a daemon thread of this process"""
+    thread = threading.Thread(target=run_prefetch_worker, args=(interval,), name='prefetch', daemon=True)
+    thread.start()
+    return thread
+
+if PREFETCH_IN_PROCESS and PREFETCH_INTERVAL > 0:
+    start_prefetch_worker()
+
+image_cache = ImageCache(IMAGE_CACHE_DIR, youtube.http, max_bytes=IMAGE_CACHE_MAX_MB * 1024 * 1024,
+                         timeout=HTTP_TIMEOUT)
+
+YTIMG_VIDEO_URL = re.compile(r'https?://i\d?\.ytimg\.com/vi(?:_webp)?/([A-Za-z0-9_-]{11})/')
+VIDEO_ID = re.compile(r'[A-Za-z0-9_-]{11}')
+
+@app.template_filter('local_thumbnail')
+def local_thumbnail(url, size='medium'):
+    """Point a YouTube video thumbnail URL at our /thumb proxy (other URLs are left alone)"""
+    match = YTIMG_VIDEO_URL.match(url or '')
+    if not IMAGE_PROXY or not match:
+        return url
+    return url_for('thumbnail', video_id=match.group(1), size=size)
+
+def code_version():
+    """Digest of the code and templates, so a deploy changes every page's ETag"""
+    digest = hashlib.sha1()
+    paths = [os.path.abspath(__file__)] + sorted(
+        os.path.join(app.root_path, 'templates', name) for name in os.listdir(os.path.join(app.root_path, 'templates')))
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+CODE_VERSION = code_version()
+
+def page_etag(*parts):
+    """ETag for a page rendered from inputs at the given versions"""
+    return hashlib.sha1(repr((CODE_VERSION,) + parts).encode()).hexdigest()[:20]
+
+def with_cache_headers(response, etag, max_age):
+    if etag:
+        response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.max_age = max_age
+    response.cache_control.must_revalidate = True
+    return response
+
+def not_modified(etag, max_age):
+    """A 304 if the browser's copy still matches etag, else None"""
+    if etag and request.if_none_match.contains_weak(etag):
+        return with_cache_headers(app.response_class(status=304), etag, max_age)
+    return None
+
+def cacheable(body, etag, max_age):
+    """Response for a rendered page, with its ETag and Cache-Control"""
+    return with_cache_headers(make_response(body), etag, max_age)
+
+def page_links(current_page, total_pages, window=2):
+    """Page numbers to link to: first, last and a window around the current page (None marks a gap)"""
+    pages = sorted({1, total_pages} | set(range(max(1, current_page - window), min(total_pages, current_page + window) + 1)))
+    links = []
+    for page in pages:
+        if links and page - links[-1] > 1:
+            links.append(None)
+        links.append(page)
+    return links
+
+# Shared pool so concurrent home page views can't exceed THUMBNAIL_WORKERS lookups in flight
+thumbnail_executor = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix='thumbnails')
+
+# Lookups still running, by key, so repeated views wait on them instead of queueing more
+thumbnail_lookups = {}
+thumbnail_lookups_lock = threading.Lock()
+
+def thumbnail_found(key, future):
+    """Done-callback for a lookup: queue its result for write-back, even if no view waited for it
+    
+    Queued before the lookup is forgotten, so home() always finds it in one place or the other.
+    """
+    try:
+        thumbnail_writer.queue({key: future.result()})
+    except Exception as e:
+        logger.warning("Error fetching thumbnail for %s: %s", key, e)
+    with thumbnail_lookups_lock:
+        thumbnail_lookups.pop(key, None)
+
+def resolve_thumbnails(jobs, deadline=THUMBNAIL_DEADLINE):
+    """Run (key, lookup, item_id) thumbnail jobs concurrently
+    
+    Returns {key: url} for the lookups that finished before the deadline; anything
+    still running is left out so the page can render a placeholder for it. Every
+    result, late ones included, is queued on thumbnail_writer as it arrives.
+    """
+    futures = {}
+    started = []
+    with thumbnail_lookups_lock:
+        for key, lookup, item_id in jobs:
+            future = thumbnail_lookups.get(key)
+            if future is None:
+                # Run each lookup in a copy of our context so quota usage is charged to this route
+                future = thumbnail_executor.submit(contextvars.copy_context().run, lookup, item_id)
+                thumbnail_lookups[key] = future
+                started.append((key, future))
+            futures[future] = key
+    # Outside the lock: a lookup that already finished runs its callback right here
+    for key, future in started:
+        future.add_done_callback(lambda future, key=key: thumbnail_found(key, future))
+    thumbnails = {}
+    
+    try:
+        for future in as_completed(futures, timeout=deadline):
+            if future.exception() is None:
+                thumbnails[futures[future]] = future.result()
+    except FuturesTimeoutError:
+        logger.info("⏱️ %d thumbnails not ready in %ss, using placeholders", len(futures) - len(thumbnails), deadline)
+    
+    return thumbnails
+
+class ThumbnailWriter:
+    """Batches resolved thumbnails and writes them back into favorites in one save"""
+    
+    def __init__(self, delay=THUMBNAIL_SAVE_DELAY):
+        self.delay = delay
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._timer = None
+    
+    def queue(self, thumbnails):
+        """Queue {(kind, id): url} to be saved at the end of the current window
+        
+        '' (looked up, nothing to show) is saved too, so home views stop asking;
+        refresh_thumbnails tries those again on its schedule. None (the lookup
+        failed) is dropped.
+        """
+        thumbnails = {key: url for key, url in thumbnails.items() if url is not None}
+        if not thumbnails:
+            return
+        
+        with self._lock:
+            self._pending.update(thumbnails)
+            if self._timer is None:
+                self._timer = threading.Timer(self.delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+    
+    def pending(self, keys):
+        """{(kind, id): url} for the keys resolved but not saved yet"""
+        with self._lock:
+            return {key: self._pending[key] for key in keys if key in self._pending}
+    
+    def flush(self):
+        """Write all pending thumbnails to favorites now"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        
+        if not pending:
+            return
+        
+        try:
+            favorites_store.set_thumbnails(
+                {item_id: url for (kind, item_id), url in pending.items() if kind == 'playlist'},
+                {item_id: url for (kind, item_id), url in pending.items() if kind == 'channel'})
+            logger.info("🖼️ Saved %d thumbnails to favorites", len(pending))
+        except Exception as e:
+            logger.exception("Error saving thumbnails: %s", e)
+
+thumbnail_writer = ThumbnailWriter()
+
+def thumbnail_jobs(playlists, channels):
+    """Thumbnail lookups for these favorites that the quota budget can spare"""
+    jobs = []
+    if youtube.can_afford('playlistItems', optional=True):
+        jobs += [(('playlist', p['id']), youtube.get_playlist_thumbnail, p['id']) for p in playlists]
+        jobs += [(('channel', c['id']), youtube.get_channel_thumbnail, c['id']) for c in channels]
+    if len(jobs) < len(playlists) + len(channels):
+        logger.info("⛽ Deferring %d thumbnail lookups to save quota", len(playlists) + len(channels) - len(jobs))
+    return jobs
+
+def refresh_thumbnails():
+    """Re-resolve artwork for every favorite (results are queued for write-back as they arrive)
+    
+    Every worker runs the schedule; only one process on the box refreshes at a time.
+    """
+    with file_lock(playlist_cache.lock_dir, 'refresh-thumbnails', timeout=0) as acquired:
+        if not acquired:
+            logger.debug("🖼️ Another process is refreshing thumbnails, skipping")
+            return
+        favorites = load_favorites()
+        resolve_thumbnails(thumbnail_jobs(favorites['playlists'], favorites['channels']), deadline=None)
+
+def start_thumbnail_refresh(interval=THUMBNAIL_REFRESH_INTERVAL):
+    """Refresh favorites' thumbnails on a schedule in a daemon thread"""
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                refresh_thumbnails()
+            except Exception as e:
+                logger.exception("Error refreshing thumbnails: %s", e)
+    
+    thread = threading.Thread(target=run, name='thumbnail-refresh', daemon=True)
+    thread.start()
+    return thread
+
+if THUMBNAIL_REFRESH_INTERVAL > 0:
+    start_thumbnail_refresh()
 
 @app.route('/')
 def home():
     """Main page with family favorites and recently watched videos"""
+    profile = current_profile()
+    etag = page_etag('home', favorites_snapshot.version(), profile, watch_history.version())
+    cached = not_modified(etag, PAGE_MAX_AGE['home'])
+    if cached:
+        return cached
+    
     favorites = load_favorites()
     
-    # Add thumbnails to playlists
-    for playlist in favorites['playlists']:
-        if 'thumbnail' not in playlist or not playlist['thumbnail']:
-            print(f"🔍 Fetching thumbnail for playlist: {playlist['title']}")
-            thumbnail_url = youtube.get_playlist_thumbnail(playlist['id'])
-            print(f"📸 Got playlist thumbnail URL: {thumbnail_url}")
-            playlist['thumbnail'] = thumbnail_url
+    # Never looked up ('' means looked up and there's no artwork yet)
+    missing_playlists = [p for p in favorites['playlists'] if p.get('thumbnail') is None]
+    missing_channels = [c for c in favorites['channels'] if c.get('video_thumbnail') is None]
+    
+    # Use thumbnails already resolved and waiting to be saved, look up the rest in parallel
+    thumbnails = thumbnail_writer.pending([('playlist', p['id']) for p in missing_playlists] +
+                                          [('channel', c['id']) for c in missing_channels])
+    jobs = thumbnail_jobs([p for p in missing_playlists if ('playlist', p['id']) not in thumbnails],
+                          [c for c in missing_channels if ('channel', c['id']) not in thumbnails])
+    if jobs:
+        logger.info("🔍 Fetching %d missing thumbnails", len(jobs))
+        etag = None  # Saving the thumbnails changes the version; don't let browsers keep this copy
+    thumbnails.update(resolve_thumbnails(jobs))
+    
+    # Add thumbnails to playlists (on copies, the loaded favorites are shared)
+    playlists = [p if p.get('thumbnail') is not None else dict(p, thumbnail=thumbnails.get(('playlist', p['id'])))
+                 for p in favorites['playlists']]
     
     # Add video thumbnails to channels
-    for channel in favorites['channels']:
-        if 'video_thumbnail' not in channel or not channel['video_thumbnail']:
-            print(f"🔍 Fetching video thumbnail for channel: {channel['title']}")
-            thumbnail_url = youtube.get_channel_thumbnail(channel['id'])
-            print(f"📸 Got channel video thumbnail URL: {thumbnail_url}")
-            channel['video_thumbnail'] = thumbnail_url
+    channels = [c if c.get('video_thumbnail') is not None
+                else dict(c, video_thumbnail=thumbnails.get(('channel', c['id'])))
+                for c in favorites['channels']]
     
     # Get recently watched videos
-    watch_history = favorites.get('watch_history', [])
-    recent_videos = watch_history[:3]
-    total_recent_videos = len(watch_history)
+    recent_videos = get_recent_videos(profile, limit=3)
+    total_recent_videos = watch_history.count(profile)
     
-    print(f"📺 Found {len(recent_videos)} recent videos for home page")
+    logger.debug("📺 Found %d recent videos for home page", len(recent_videos))
     
-    return render_template('index.html', 
-                         playlists=favorites['playlists'], 
-                         channels=favorites['channels'],
-                         recent_videos=recent_videos,
-                         total_recent_videos=total_recent_videos)
+    return cacheable(render_template('index.html', 
+                                     playlists=playlists, 
+                                     channels=channels,
+                                     recent_videos=recent_videos,
+                                     total_recent_videos=total_recent_videos,
+                                     profiles=HISTORY_PROFILES,
+                                     profile=profile),
+                     etag, PAGE_MAX_AGE['home'])
+
+@app.route('/recent')
+def recent():
+    """All recently watched videos for the current profile"""
+    profile = current_profile()
+    # The page shows admin controls, so a login or logout must change its ETag
+    etag = page_etag('recent', profile, bool(session.get('admin_logged_in')), watch_history.version())
+    cached = not_modified(etag, PAGE_MAX_AGE['home'])
+    if cached:
+        return cached
+
+    return cacheable(render_template('recent.html', recent_videos=get_recent_videos(profile), profile=profile),
+                     etag, PAGE_MAX_AGE['home'])
+
+@app.route('/profile/<name>')
+def switch_profile(name):
+    """Pick whose watch history this browser records and shows"""
+    if name in HISTORY_PROFILES:
+        session['profile'] = name
+    return redirect(url_for('home'))
 
 @app.route('/admin')
 def admin():
@@ -682,9 +1397,7 @@ def admin_export():
     if not session.get('admin_logged_in'):
         return redirect(url_for('admin_login'))
     
-    favorites = load_favorites()
-    favorites_json = json.dumps(favorites)
-    favorites_b64 = base64.b64encode(favorites_json.encode('utf-8')).decode('utf-8')
+    favorites_b64 = encode_favorites(export_favorites())
     
     return render_template('admin_export.html', favorites_data=favorites_b64)
 
@@ -694,10 +1407,13 @@ def admin_history():
     if not session.get('admin_logged_in'):
         return redirect(url_for('admin_login'))
     
-    favorites = load_favorites()
-    watch_history = favorites.get('watch_history', [])
+    profile = requested_profile()
     
-    return render_template('admin_history.html', watch_history=watch_history)
+    return render_template('admin_history.html',
+                         watch_history=get_recent_videos(profile),
+                         profiles=HISTORY_PROFILES,
+                         profile=profile,
+                         limit=HISTORY_LIMIT)
 
 @app.route('/admin/history/clear')
 def admin_clear_history():
@@ -705,12 +1421,12 @@ def admin_clear_history():
     if not session.get('admin_logged_in'):
         return redirect(url_for('admin_login'))
     
-    favorites = load_favorites()
-    favorites['watch_history'] = []
-    save_favorites(favorites)
+    profile = requested_profile()
+    watch_history.clear(profile)
+    history_changed()
     
     flash('✅ Watch history cleared!', 'success')
-    return redirect(url_for('admin'))
+    return redirect(url_for('admin_history', profile=profile))
 
 @app.route('/admin/history/remove/<video_id>')
 def admin_remove_from_history(video_id):
@@ -718,12 +1434,37 @@ def admin_remove_from_history(video_id):
     if not session.get('admin_logged_in'):
         return redirect(url_for('admin_login'))
     
-    favorites = load_favorites()
-    favorites['watch_history'] = [item for item in favorites.get('watch_history', []) if item['id'] != video_id]
-    save_favorites(favorites)
+    profile = requested_profile()
+    watch_history.remove(video_id, profile)
+    history_changed()
     
     flash('✅ Video removed from history!', 'success')
-    return redirect(url_for('admin_history'))
+    return redirect(url_for('admin_history', profile=profile))
+
+@app.route('/admin/quota')
+def admin_quota():
+    """Today's YouTube quota usage, by route and endpoint"""
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('admin_login'))
+    
+    return jsonify(youtube.quota.usage(request.args.get('day')))
+
+@app.route('/admin/metrics')
+def admin_metrics():
+    """Per-route latency, upstream calls and cache hit rates for this worker"""
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('admin_login'))
+    
+    return render_template('admin_metrics.html', summary=metrics.summary(), inf=float('inf'))
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Metrics in the Prometheus text format (admin session or METRICS_TOKEN bearer token)"""
+    token = request.headers.get('Authorization', '')
+    if not session.get('admin_logged_in') and not (METRICS_TOKEN and token == f'Bearer {METRICS_TOKEN}'):
+        abort(403)
+    
+    return app.response_class(metrics.prometheus(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/admin/logout')
 def admin_logout():
@@ -749,29 +1490,24 @@ def admin_add():
         flash(error, 'error')
         return redirect(url_for('admin'))
     
-    # Load current favorites
-    favorites = load_favorites()
-    
     # Determine if it's a playlist or channel
     if 'playlist?list=' in url:
-        # Check if already exists
-        if any(p['id'] == info['id'] for p in favorites['playlists']):
+        # Add unless it already exists
+        if favorites_snapshot.find('playlists', info['id']) or not favorites_store.add_item('playlists', info):
             flash('Playlist already exists!', 'error')
         else:
-            favorites['playlists'].append(info)
-            save_favorites(favorites)
+            favorites_changed()
             flash(f'✅ Added playlist: {info["title"]}', 'success')
             if DO_API_TOKEN and DO_APP_ID:
                 flash('🔄 Automatically updating environment variables...', 'info')
             else:
                 flash('💡 Remember to update your FAVORITES_DATA environment variable to make this permanent!', 'warning')
     else:
-        # Check if already exists
-        if any(c['id'] == info['id'] for c in favorites['channels']):
+        # Add unless it already exists
+        if favorites_snapshot.find('channels', info['id']) or not favorites_store.add_item('channels', info):
             flash('Channel already exists!', 'error')
         else:
-            favorites['channels'].append(info)
-            save_favorites(favorites)
+            favorites_changed()
             flash(f'✅ Added channel: {info["title"]}', 'success')
             if DO_API_TOKEN and DO_APP_ID:
                 flash('🔄 Automatically updating environment variables...', 'info')
@@ -786,16 +1522,14 @@ def admin_remove(item_type, item_id):
     if not session.get('admin_logged_in'):
         return redirect(url_for('admin_login'))
     
-    favorites = load_favorites()
-    
     if item_type == 'playlist':
-        favorites['playlists'] = [p for p in favorites['playlists'] if p['id'] != item_id]
+        favorites_store.remove_item('playlists', item_id)
         flash('✅ Playlist removed!', 'success')
     elif item_type == 'channel':
-        favorites['channels'] = [c for c in favorites['channels'] if c['id'] != item_id]
+        favorites_store.remove_item('channels', item_id)
         flash('✅ Channel removed!', 'success')
     
-    save_favorites(favorites)
+    favorites_changed()
     
     if DO_API_TOKEN and DO_APP_ID:
         flash('🔄 Automatically updating environment variables...', 'info')
@@ -809,7 +1543,17 @@ def search():
     """Search for videos"""
     query = request.args.get('q', '')
     if not query:
-        return render_template('search.html', videos=[], query='')
+        etag = page_etag('search')
+        return (not_modified(etag, PAGE_MAX_AGE['search'])
+                or cacheable(render_template('search.html', videos=[], query=''), etag, PAGE_MAX_AGE['search']))
+    
+    def search_etag():
+        version = youtube.search_cache.fresh_version(youtube.search_key(query)) if youtube.search_cache else None
+        return page_etag('search', query, version) if version else None
+    
+    cached = not_modified(search_etag(), PAGE_MAX_AGE['search'])
+    if cached:
+        return cached
     
     try:
         results = youtube.search_videos(query)
@@ -830,7 +1574,7 @@ def search():
                     }
                     videos.append(video)
         
-        return render_template('search.html', videos=videos, query=query)
+        return cacheable(render_template('search.html', videos=videos, query=query), search_etag(), PAGE_MAX_AGE['search'])
         
     except Exception as e:
         error_message = f"Search error: {str(e)}"
@@ -839,74 +1583,64 @@ def search():
 @app.route('/playlist/<playlist_id>')
 def playlist(playlist_id):
     """View playlist videos"""
-    favorites = load_favorites()
+    key = ('playlist', playlist_id)
+    
+    def playlist_etag():
+        version = playlist_cache.fresh_version(key)
+        return page_etag('playlist', playlist_id, favorites_snapshot.version(), version) if version else None
+    
+    cached = not_modified(playlist_etag(), PAGE_MAX_AGE['playlist'])
+    if cached:
+        return cached
     
     # Find playlist title from our favorites
-    playlist_title = "Playlist"
-    for playlist in favorites['playlists']:
-        if playlist['id'] == playlist_id:
-            playlist_title = playlist['title']
-            break
+    favorite = favorites_snapshot.find('playlists', playlist_id)
+    playlist_title = favorite['title'] if favorite else "Playlist"
     
-    results = youtube.get_playlist_videos(playlist_id)
-    videos = []
+    # Usually precomputed by the prefetch worker
+    videos = playlist_cache.get_or_fetch(key, lambda: build_playlist_videos(playlist_id),
+                                         allow_refresh=youtube.can_afford('playlistItems', optional=True))
+    videos = videos or []
     
-    if results and 'items' in results:
-        for item in results['items']:
-            # Check if this is a valid video item
-            if ('snippet' in item and 
-                'resourceId' in item['snippet'] and 
-                'videoId' in item['snippet']['resourceId']):
-                
-                video_id = item['snippet']['resourceId']['videoId']
-                
-                # Skip deleted or private videos
-                if video_id and item['snippet']['title'] != 'Deleted video':
-                    # Check if video is embeddable
-                    if youtube.check_video_embeddable(video_id):
-                        print(f"🎵 Found embeddable playlist video: {video_id} - {item['snippet']['title']}")
-                        video = {
-                            'id': video_id,
-                            'title': item['snippet']['title'],
-                            'channel': item['snippet'].get('channelTitle', 'Unknown Channel'),
-                            'thumbnail': item['snippet']['thumbnails']['medium']['url'] if 'thumbnails' in item['snippet'] else '',
-                            'description': item['snippet']['description'][:100] + '...' if len(item['snippet']['description']) > 100 else item['snippet']['description']
-                        }
-                        videos.append(video)
-                    else:
-                        print(f"⚠️ Skipping non-embeddable video: {video_id} - {item['snippet']['title']}")
-    
-    return render_template('playlist.html', videos=videos, playlist_title=playlist_title)
+    return cacheable(render_template('playlist.html', videos=videos, playlist_title=playlist_title),
+                     playlist_etag(), PAGE_MAX_AGE['playlist'])
 
 @app.route('/channel/<channel_id>')
 @app.route('/channel/<channel_id>/<tab>')
 def channel(channel_id, tab='videos'):
     """View channel videos or playlists with tabs"""
-    favorites = load_favorites()
-    page = int(request.args.get('page', 1))
+    page = max(1, request.args.get('page', 1, type=int))
+    
+    if tab == 'playlists':
+        def channel_etag():
+            version = channel_page_cache.fresh_version(('playlists', channel_id, page))
+            return page_etag('channel', channel_id, tab, page, favorites_snapshot.version(), version,
+                             channel_index.known_pages(channel_id, 'playlists')) if version else None
+    else:
+        # Picks up new uploads first, the page's version depends on them
+        channel_index.sync(channel_id)
+        
+        def channel_etag():
+            return page_etag('channel', channel_id, tab, page, favorites_snapshot.version(),
+                             channel_index.version(channel_id))
     
-    # Calculate page token based on page number
-    page_token = None
-    if page > 1:
-        # This is a simplified approach - in practice you'd need to store page tokens
-        # For now, we'll use a basic calculation
-        page_token = request.args.get('pageToken')
+    cached = not_modified(channel_etag(), PAGE_MAX_AGE['channel'])
+    if cached:
+        return cached
     
     # Find channel title from our favorites
-    channel_title = "Channel"
-    for channel in favorites['channels']:
-        if channel['id'] == channel_id:
-            channel_title = channel['title']
-            break
+    favorite = favorites_snapshot.find('channels', channel_id)
+    channel_title = favorite['title'] if favorite else "Channel"
     
     videos = []
     playlists = []
-    next_page_token = None
-    total_results = 0
+    has_next = False
+    estimated_total_pages = 1
     
     if tab == 'playlists':
-        # Get channel playlists
-        results = youtube.get_channel_playlists(channel_id)
+        # Get channel playlists, one page at a time
+        results, has_next = get_channel_playlists_page(channel_id, page)
+        estimated_total_pages = max(page + (1 if has_next else 0), channel_index.known_pages(channel_id, 'playlists'))
         if results and 'items' in results:
             for item in results['items']:
                 playlist = {
@@ -917,46 +1651,40 @@ def channel(channel_id, tab='videos'):
                 }
                 playlists.append(playlist)
     else:
-        # Get recent videos with pagination
-        results = youtube.get_channel_videos_recent_fast(channel_id, page_token=page_token)
-        if results:
-            next_page_token = results.get('nextPageToken')
-            total_results = results.get('pageInfo', {}).get('totalResults', 0)
-            
-            if 'items' in results:
-                for item in results['items']:
-                    if ('snippet' in item and 
-                        'id' in item and 
-                        'videoId' in item['id']):
-                        
-                        video_id = item['id']['videoId']
-                        
-                        if video_id and item['snippet']['title'] != 'Deleted video':
-                            video = {
-                                'id': video_id,
-                                'title': item['snippet']['title'],
-                                'channel': item['snippet'].get('channelTitle', 'Unknown Channel'),
-                                'thumbnail': item['snippet']['thumbnails']['medium']['url'] if 'thumbnails' in item['snippet'] else '',
-                                'description': item['snippet']['description'][:100] + '...' if len(item['snippet']['description']) > 100 else item['snippet']['description']
-                            }
-                            videos.append(video)
+        # Videos come from the local channel index, which only fetches new uploads
+        videos, has_next, estimated_total_pages = channel_index.get_page(channel_id, page, per_page=20)
+        if has_next:
+            channel_index.prefetch(channel_id, page + 1, per_page=20)
     
     # Calculate pagination info
-    has_next = bool(next_page_token)
     has_prev = page > 1
-    estimated_total_pages = min(10, (total_results // 20) + 1) if total_results > 0 else 1
-    
-    return render_template('channel.html', 
-                         videos=videos, 
-                         playlists=playlists,
-                         channel_title=channel_title,
-                         channel_id=channel_id,
-                         current_tab=tab,
-                         current_page=page,
-                         has_next=has_next,
-                         has_prev=has_prev,
-                         next_page_token=next_page_token,
-                         estimated_total_pages=estimated_total_pages)
+    
+    return cacheable(render_template('channel.html', 
+                                     videos=videos, 
+                                     playlists=playlists,
+                                     channel_title=channel_title,
+                                     channel_id=channel_id,
+                                     current_tab=tab,
+                                     current_page=page,
+                                     has_next=has_next,
+                                     has_prev=has_prev,
+                                     estimated_total_pages=estimated_total_pages,
+                                     page_links=page_links(page, estimated_total_pages)),
+                     channel_etag(), PAGE_MAX_AGE['channel'])
+
+@app.route('/thumb/<video_id>/<size>')
+def thumbnail(video_id, size):
+    """Serve a video thumbnail from the local image cache"""
+    if size not in THUMBNAIL_SIZES or not VIDEO_ID.fullmatch(video_id):
+        abort(404)
+    
+    cached = image_cache.get(video_id, size)
+    if cached is None:
+        # Let the browser try YouTube itself
+        return redirect(YTIMG_URL.format(video_id=video_id, variant=THUMBNAIL_SIZES[size][0]))
+    
+    path, digest = cached
+    return send_file(path, mimetype='image/jpeg', etag=digest, max_age=IMAGE_MAX_AGE)
 
 @app.route('/watch/<video_id>')
 def watch(video_id):
@@ -969,11 +1697,11 @@ def watch(video_id):
         flash(f'Invalid video ID: {video_id}', 'error')
         return redirect(url_for('home'))
     
-    # Add to watch history
-    add_to_watch_history(video_id)
+    # Add to watch history in the background so playback isn't held up
+    history_writer.queue(video_id, current_profile())
     
     # Log for debugging
-    print(f"🎬 Playing video ID: {video_id}")
+    logger.debug("🎬 Playing video ID: %s", video_id)
     
     return render_template('watch.html', video_id=video_id)
 
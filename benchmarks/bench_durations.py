@@ -0,0 +1,75 @@
+"""Microbenchmark for shorts detection
+
+Compares the old per-video parser (three re.search calls, no day component)
+with durations.regular_flags over a batch shaped like a channel's uploads:
+
+    python benchmarks/bench_durations.py --videos 5000 --repeat 20
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from durations import DEFAULT_SHORTS_MAX_SECONDS, regular_flags  # noqa: E402
+
+
+def legacy_is_regular(video_details):
+    """The parser YouTubeAPI.is_regular_video used before durations.py"""
+    duration = video_details.get('contentDetails', {}).get('duration', '')
+    if duration.startswith('PT'):
+        hours_match = re.search(r'(\d+)H', duration)
+        minutes_match = re.search(r'(\d+)M', duration)
+        seconds_match = re.search(r'(\d+)S', duration)
+        hours = int(hours_match.group(1)) if hours_match else 0
+        minutes = int(minutes_match.group(1)) if minutes_match else 0
+        seconds = int(seconds_match.group(1)) if seconds_match else 0
+        return hours * 3600 + minutes * 60 + seconds > DEFAULT_SHORTS_MAX_SECONDS
+    return True
+
+
+def sample_details(count, seed=0):
+    """videos.list items with a realistic mix of shorts, regular videos and long streams"""
+    rng = random.Random(seed)
+    durations = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < 0.3:
+            durations.append(f'PT{rng.randint(5, 59)}S')
+        elif roll < 0.9:
+            durations.append(f'PT{rng.randint(1, 45)}M{rng.randint(0, 59)}S')
+        elif roll < 0.98:
+            durations.append(f'PT{rng.randint(1, 9)}H{rng.randint(0, 59)}M{rng.randint(0, 59)}S')
+        else:
+            durations.append(f'P{rng.randint(1, 3)}DT{rng.randint(0, 23)}H')
+    return [{'id': str(i), 'contentDetails': {'duration': d}} for i, d in enumerate(durations)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--videos', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    details = sample_details(args.videos)
+    legacy = [legacy_is_regular(d) for d in details]
+    current = regular_flags(details)
+    disagreements = sum(a != b for a, b in zip(legacy, current))
+
+    legacy_time = min(timeit.repeat(lambda: [legacy_is_regular(d) for d in details],
+                                    number=1, repeat=args.repeat))
+    current_time = min(timeit.repeat(lambda: regular_flags(details), number=1, repeat=args.repeat))
+
+    per_video = 1e6 / args.videos
+    print(f"{args.videos} videos, best of {args.repeat}")
+    print(f"  legacy (3x re.search): {legacy_time * 1000:8.2f} ms  {legacy_time * per_video:6.2f} us/video")
+    print(f"  regular_flags:         {current_time * 1000:8.2f} ms  {current_time * per_video:6.2f} us/video")
+    print(f"  speedup: {legacy_time / current_time:.2f}x; "
+          f"{disagreements} videos classified differently")
+
+
+if __name__ == '__main__':
+    main()
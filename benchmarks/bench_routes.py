@@ -0,0 +1,202 @@
+"""Route benchmarks against the local YouTube stand-in (tools/fake_youtube.py)
+
+Measures request latency, upstream calls and quota units for home, playlist,
+channel and search with favorites sets of different sizes, without touching
+the real API:
+
+    python benchmarks/bench_routes.py                          # 10, 100 and 1000 favorites
+    python benchmarks/bench_routes.py --favorites 100 --latency-ms 80 --repeat 20
+    python benchmarks/bench_routes.py --save before.json       # then change something...
+    python benchmarks/bench_routes.py --compare before.json
+
+Each favorites size runs in its own process, in a fresh temporary directory,
+so every run starts with empty caches. "cold" is the first request for a page;
+"warm" is the same page requested again --repeat times.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'tools'))
+
+METRICS = ('cold_ms', 'cold_calls', 'cold_units', 'warm_p50_ms', 'warm_p95_ms', 'warm_calls')
+
+
+def fake_stats(base_url):
+    import requests
+    return requests.get(f'{base_url}/stats', timeout=5).json()
+
+
+def reset_fake_stats(base_url):
+    import requests
+    requests.post(f'{base_url}/stats/reset', timeout=5)
+
+
+def settle(base_url, quiet_for=0.2, timeout=10):
+    """Wait until background work (prefetches, refreshes) stops calling the fake API"""
+    deadline = time.monotonic() + timeout
+    calls = None
+    while time.monotonic() < deadline:
+        current = sum(fake_stats(base_url)['calls'].values())
+        if current == calls:
+            return
+        calls = current
+        time.sleep(quiet_for)
+
+
+def run_one(favorites, args):
+    """Benchmark one favorites size in this process; returns {route: {metric: value}}"""
+    from werkzeug.serving import make_server
+
+    import fake_youtube
+
+    fake_youtube.configure(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, quota=args.quota,
+                           quota_error_rate=args.quota_error_rate, fixtures=args.fixtures)
+    server = make_server('127.0.0.1', 0, fake_youtube.fake_yt, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+
+    # Fresh caches and stores for every run
+    os.chdir(tempfile.mkdtemp(prefix='bench-routes-'))
+    os.environ.update({
+        'YOUTUBE_API_BASE': f'{base_url}/youtube/v3',
+        'YOUTUBE_API_KEY': 'bench',
+        'PREFETCH_IN_PROCESS': '0',
+        'THUMBNAIL_REFRESH_INTERVAL': '0',
+        'DO_API_TOKEN': '',
+        'FAVORITES_DATA': '',
+    })
+    import app
+
+    playlists = favorites // 2
+    for i in range(playlists):
+        app.favorites_store.add_item('playlists', {'id': f'PLbench{i}', 'title': f'Playlist {i}', 'description': ''})
+    for i in range(favorites - playlists):
+        app.favorites_store.add_item('channels', {'id': f'UCbench{i}', 'title': f'Channel {i}', 'description': '',
+                                                  'thumbnail': None})
+
+    client = app.app.test_client()
+    routes = [
+        ('home', '/'),
+        ('playlist', '/playlist/PLbench0'),
+        ('channel', '/channel/UCbench0'),
+        ('channel page 3', '/channel/UCbench0?page=3'),
+        ('channel playlists', '/channel/UCbench0/playlists'),
+        ('search', '/search?q=dinosaurs'),
+    ]
+
+    results = {}
+    for name, url in routes:
+        reset_fake_stats(base_url)
+        started = time.perf_counter()
+        response = client.get(url)
+        cold_ms = (time.perf_counter() - started) * 1000
+        if response.status_code != 200:
+            print(f"⚠️ {url} answered {response.status_code}", file=sys.stderr)
+
+        # Let background work (thumbnails found by the cold home page) finish first; the cold
+        # numbers include the calls the page set off in the background. Their write-back is
+        # left pending, as it would be for the next visitor in production.
+        settle(base_url)
+        cold = fake_stats(base_url)
+
+        reset_fake_stats(base_url)
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            client.get(url)
+            timings.append((time.perf_counter() - started) * 1000)
+        warm = fake_stats(base_url)
+
+        results[name] = {
+            'cold_ms': cold_ms,
+            'cold_calls': sum(cold['calls'].values()),
+            'cold_units': cold['units'],
+            'warm_p50_ms': statistics.median(timings),
+            'warm_p95_ms': sorted(timings)[max(0, int(len(timings) * 0.95) - 1)],
+            'warm_calls': sum(warm['calls'].values()) / args.repeat,
+        }
+    server.shutdown()
+    return results
+
+
+def run_size(favorites, args):
+    """Run one favorites size in a subprocess so module-level caches start empty"""
+    with tempfile.NamedTemporaryFile('r', suffix='.json') as output:
+        command = [sys.executable, os.path.abspath(__file__), '--run-one', str(favorites), '--output', output.name,
+                   '--repeat', str(args.repeat), '--latency-ms', str(args.latency_ms),
+                   '--jitter-ms', str(args.jitter_ms), '--quota-error-rate', str(args.quota_error_rate)]
+        if args.quota is not None:
+            command += ['--quota', str(args.quota)]
+        if args.fixtures:
+            command += ['--fixtures', os.path.abspath(args.fixtures)]
+        quiet = None if args.verbose else subprocess.DEVNULL
+        subprocess.run(command, check=True, stdout=quiet, stderr=quiet)
+        return json.load(output)
+
+
+def print_results(results, baseline=None):
+    for favorites, routes in results.items():
+        print(f"\n{favorites} favorites")
+        print(f"  {'route':<18} {'cold ms':>9} {'calls':>6} {'units':>6} {'warm p50':>9} {'warm p95':>9} {'calls/req':>9}")
+        for name, values in routes.items():
+            cells = [f"{values['cold_ms']:9.1f}", f"{values['cold_calls']:6d}", f"{values['cold_units']:6d}",
+                     f"{values['warm_p50_ms']:9.1f}", f"{values['warm_p95_ms']:9.1f}", f"{values['warm_calls']:9.2f}"]
+            print(f"  {name:<18} " + ' '.join(cells))
+
+            before = (baseline or {}).get(favorites, {}).get(name)
+            if before:
+                deltas = []
+                for metric, width in zip(METRICS, (9, 6, 6, 9, 9, 9)):
+                    change = values[metric] - before[metric]
+                    deltas.append(f"{change:+{width}.1f}" if change else ' ' * (width - 1) + '=')
+                print(f"  {'  vs baseline':<18} " + ' '.join(deltas))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--favorites', type=int, nargs='+', default=[10, 100, 1000],
+                        help='favorites set sizes (half playlists, half channels)')
+    parser.add_argument('--repeat', type=int, default=10, help='warm requests per route')
+    parser.add_argument('--latency-ms', type=float, default=50, help='fake API latency per call')
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--quota', type=int, default=None, help='fake API quota, in units')
+    parser.add_argument('--quota-error-rate', type=float, default=0.0)
+    parser.add_argument('--fixtures', help='recorded responses for the fake API to replay')
+    parser.add_argument('--save', help='write results to this JSON file')
+    parser.add_argument('--compare', help='show changes against results saved with --save')
+    parser.add_argument('--verbose', action='store_true', help="show the app's own output")
+    parser.add_argument('--run-one', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--output', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one is not None:
+        results = run_one(args.run_one, args)
+        with open(args.output, 'w') as f:
+            json.dump(results, f)
+        # Skip atexit hooks (history and DigitalOcean flushes) of the throwaway app
+        os._exit(0)
+
+    results = {str(favorites): run_size(favorites, args) for favorites in args.favorites}
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved to {args.save}")
+
+
+if __name__ == '__main__':
+    main()
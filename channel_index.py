@@ -0,0 +1,299 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from singleflight import file_lock
+
+logger = logging.getLogger(__name__)
+
+
+def short_description(description):
+    """Trim a description the way the channel and playlist pages show it"""
+    return description[:100] + '...' if len(description) > 100 else description
+
+
+class ChannelIndex:
+    """Local index of each channel's videos, synced incrementally from its uploads playlist
+
+    The first visit indexes the newest `initial_pages` pages of uploads. Later
+    syncs walk the uploads playlist from the top only until they reach a video
+    we already know, so their cost scales with new uploads rather than channel
+    size. Older pages are backfilled on demand when someone pages past the end
+    of what's indexed, at most `max_backfill_pages` uploads pages per request.
+    """
+
+    def __init__(self, db_path, youtube, sync_interval=900, initial_pages=2, max_sync_pages=4,
+                 max_backfill_pages=3):
+        self.db_path = db_path
+        self.youtube = youtube
+        self.sync_interval = sync_interval
+        self.initial_pages = initial_pages
+        self.max_sync_pages = max_sync_pages
+        self.max_backfill_pages = max_backfill_pages
+        self.lock_dir = db_path + '.locks'
+        self._local = threading.local()
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        self._init_db()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS channel_videos (
+                    channel_id TEXT NOT NULL,
+                    video_id TEXT NOT NULL,
+                    title TEXT,
+                    description TEXT,
+                    channel_title TEXT,
+                    thumbnail TEXT,
+                    duration TEXT,
+                    is_short INTEGER NOT NULL,
+                    embeddable INTEGER NOT NULL,
+                    published_at TEXT,
+                    PRIMARY KEY (channel_id, video_id)
+                );
+                CREATE INDEX IF NOT EXISTS idx_channel_videos_published
+                    ON channel_videos (channel_id, published_at DESC);
+                CREATE TABLE IF NOT EXISTS channel_sync (
+                    channel_id TEXT PRIMARY KEY,
+                    synced_at REAL NOT NULL,
+                    backfill_token TEXT,
+                    complete INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS page_cursors (
+                    channel_id TEXT NOT NULL,
+                    tab TEXT NOT NULL,
+                    page INTEGER NOT NULL,
+                    page_token TEXT NOT NULL,
+                    PRIMARY KEY (channel_id, tab, page)
+                );
+            ''')
+
+    def _channel_lock(self, channel_id):
+        with self._locks_lock:
+            return self._locks.setdefault(channel_id, threading.Lock())
+
+    def _sync_state(self, channel_id):
+        return self._connect().execute(
+            'SELECT synced_at, backfill_token, complete FROM channel_sync WHERE channel_id = ?',
+            (channel_id,)).fetchone()
+
+    def _known_ids(self, channel_id, video_ids):
+        video_ids = list(video_ids)
+        if not video_ids:
+            return set()
+        rows = self._connect().execute(
+            'SELECT video_id FROM channel_videos WHERE channel_id = ? AND video_id IN (%s)'
+            % ','.join('?' * len(video_ids)), [channel_id] + video_ids).fetchall()
+        return {row['video_id'] for row in rows}
+
+    def _store(self, channel_id, items):
+        """Look up details for search-shaped items in one batch and index them"""
+        video_ids = [item['id']['videoId'] for item in items]
+        details_by_id = self.youtube.get_videos_details(video_ids, part='status,contentDetails,snippet')
+
+        details_list = [details_by_id.get(item['id']['videoId']) for item in items]
+
+        rows = []
+        for item, details, regular in zip(items, details_list, self.youtube.regular_flags(details_list)):
+            if not details:
+                continue  # Deleted or private
+            snippet = details['snippet']
+            rows.append((
+                channel_id,
+                details['id'],
+                snippet.get('title', ''),
+                short_description(snippet.get('description', '') or item['snippet'].get('description', '')),
+                snippet.get('channelTitle', 'Unknown Channel'),
+                snippet.get('thumbnails', {}).get('medium', {}).get('url', ''),
+                details['contentDetails'].get('duration', ''),
+                0 if regular else 1,
+                1 if details['status'].get('embeddable', False) else 0,
+                snippet.get('publishedAt') or item['snippet'].get('publishedAt', ''),
+            ))
+
+        with self._connect() as conn:
+            conn.executemany('''
+                INSERT OR REPLACE INTO channel_videos
+                    (channel_id, video_id, title, description, channel_title, thumbnail,
+                     duration, is_short, embeddable, published_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+        return len(rows)
+
+    def sync(self, channel_id, force=False, ahead=0):
+        """Fetch uploads newer than the newest indexed video; returns how many were added
+
+        Skipped while the last sync is under sync_interval old, and still will be in `ahead` seconds.
+        """
+        state = self._sync_state(channel_id)
+        if state and not force and time.time() + ahead - state['synced_at'] < self.sync_interval:
+            return 0
+
+        # One sync per channel at a time, across threads and worker processes
+        with self._channel_lock(channel_id), file_lock(self.lock_dir, ('sync', channel_id)):
+            # Another thread or worker may have synced while we waited
+            state = self._sync_state(channel_id)
+            if state and not force and time.time() + ahead - state['synced_at'] < self.sync_interval:
+                return 0
+
+            first_sync = state is None
+            max_pages = self.initial_pages if first_sync else self.max_sync_pages
+            added = 0
+            page_token = None
+            reached_known = False
+
+            for _ in range(max_pages):
+                data = self.youtube.get_channel_uploads(channel_id, page_token=page_token)
+                if data is None:
+                    # Keep what we had; the next visit tries again
+                    return added
+
+                items = data['items']
+                known = self._known_ids(channel_id, (item['id']['videoId'] for item in items))
+                new_items = []
+                for item in items:
+                    if item['id']['videoId'] in known:
+                        reached_known = True
+                        break
+                    new_items.append(item)
+                added += self._store(channel_id, new_items)
+
+                page_token = data.get('nextPageToken')
+                if reached_known or not page_token:
+                    break
+
+            with self._connect() as conn:
+                if first_sync or not reached_known:
+                    # Everything older than where we stopped still needs backfilling
+                    conn.execute('''
+                        INSERT OR REPLACE INTO channel_sync (channel_id, synced_at, backfill_token, complete)
+                        VALUES (?, ?, ?, ?)
+                    ''', (channel_id, time.time(), page_token, 0 if page_token else 1))
+                else:
+                    conn.execute('UPDATE channel_sync SET synced_at = ? WHERE channel_id = ?',
+                                 (time.time(), channel_id))
+
+            if added:
+                logger.debug("🔄 Indexed %d new videos for channel %s", added, channel_id)
+            return added
+
+    def backfill(self, channel_id, pages=1):
+        """Index older uploads, continuing from where the last sync or backfill stopped"""
+        with self._channel_lock(channel_id):
+            state = self._sync_state(channel_id)
+            if state is None or state['complete']:
+                return 0
+
+            added = 0
+            page_token = state['backfill_token']
+            for _ in range(pages):
+                data = self.youtube.get_channel_uploads(channel_id, page_token=page_token)
+                if data is None:
+                    break
+                added += self._store(channel_id, data['items'])
+                page_token = data.get('nextPageToken')
+                if not page_token:
+                    break
+
+            with self._connect() as conn:
+                conn.execute('UPDATE channel_sync SET backfill_token = ?, complete = ? WHERE channel_id = ?',
+                             (page_token, 0 if page_token else 1, channel_id))
+            return added
+
+    def _count(self, channel_id):
+        return self._connect().execute(
+            'SELECT COUNT(*) FROM channel_videos WHERE channel_id = ? AND is_short = 0 AND embeddable = 1',
+            (channel_id,)).fetchone()[0]
+
+    def get_page(self, channel_id, page, per_page=20):
+        """Return (videos, has_next, total_pages) for one page of a channel's regular, embeddable videos
+
+        total_pages is exact once the whole channel is indexed, otherwise it's
+        what we know so far plus one.
+        """
+        # Backfill until this page (and one more video, to know if there's a next page) is indexed.
+        # Pages beyond the one after what's indexed (a hand-edited ?page=) aren't backfilled, so
+        # they can't walk the whole channel while the request waits; they just come back empty.
+        state = self._sync_state(channel_id)
+        count = self._count(channel_id)
+        needed = min(page, count // per_page + 1) * per_page + 1
+        for _ in range(self.max_backfill_pages):
+            if not state or state['complete'] or count >= needed:
+                break
+            if not self.backfill(channel_id):
+                break
+            state = self._sync_state(channel_id)
+            count = self._count(channel_id)
+
+        rows = self._connect().execute('''
+            SELECT video_id, title, description, channel_title, thumbnail FROM channel_videos
+            WHERE channel_id = ? AND is_short = 0 AND embeddable = 1
+            ORDER BY published_at DESC, video_id
+            LIMIT ? OFFSET ?
+        ''', (channel_id, per_page, (page - 1) * per_page)).fetchall()
+
+        videos = [{
+            'id': row['video_id'],
+            'title': row['title'],
+            'channel': row['channel_title'],
+            'thumbnail': row['thumbnail'],
+            'description': row['description']
+        } for row in rows]
+
+        total = self._count(channel_id)
+        complete = state is None or bool(state['complete'])
+        has_next = total > page * per_page or not complete
+        total_pages = max(1, -(-total // per_page)) + (0 if complete else 1)
+        return videos, has_next, total_pages
+
+    def version(self, channel_id):
+        """Token that changes whenever the channel's indexed videos do"""
+        row = self._connect().execute('''
+            SELECT COUNT(*), MAX(published_at), SUM(embeddable), SUM(is_short)
+            FROM channel_videos WHERE channel_id = ?
+        ''', (channel_id,)).fetchone()
+        state = self._sync_state(channel_id)
+        return tuple(row) + ((state['complete'], state['backfill_token']) if state else (None, None))
+
+    def prefetch(self, channel_id, page, per_page=20):
+        """Backfill in the background so `page` is indexed before anyone asks for it"""
+        state = self._sync_state(channel_id)
+        if state is None or state['complete'] or self._count(channel_id) > page * per_page:
+            return
+        threading.Thread(target=self.get_page, args=(channel_id, page, per_page), daemon=True,
+                         name='channel-prefetch').start()
+
+    def page_token(self, channel_id, tab, page):
+        """The upstream pageToken that fetches `page` of a token-paged listing, if we've seen it"""
+        row = self._connect().execute(
+            'SELECT page_token FROM page_cursors WHERE channel_id = ? AND tab = ? AND page = ?',
+            (channel_id, tab, page)).fetchone()
+        return row['page_token'] if row else None
+
+    def record_page_token(self, channel_id, tab, page, page_token):
+        """Remember the pageToken for `page` so it can be fetched directly later"""
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO page_cursors (channel_id, tab, page, page_token) VALUES (?, ?, ?, ?)',
+                         (channel_id, tab, page, page_token))
+
+    def known_pages(self, channel_id, tab):
+        """How many pages of a token-paged listing we can link to directly"""
+        row = self._connect().execute(
+            'SELECT MAX(page) FROM page_cursors WHERE channel_id = ? AND tab = ?', (channel_id, tab)).fetchone()
+        return row[0] or 1
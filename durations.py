@@ -0,0 +1,44 @@
+import re
+
+# YouTube Shorts are typically 60 seconds or less; we're a little conservative
+DEFAULT_SHORTS_MAX_SECONDS = 65
+
+# Calendar units don't have a fixed length; these are the usual approximations
+_UNIT_SECONDS = (365 * 86400, 30 * 86400, 7 * 86400, 86400, 3600, 60, 1)
+
+# PnYnMnWnDTnHnMnS, every component optional (P1DT2H, PT1M30S, PT45.5S, P0D)
+_DURATION_RE = re.compile(
+    r'P(?:(\d+)Y)?(?:(\d+)M)?(?:(\d+)W)?(?:(\d+)D)?'
+    r'(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+(?:[.,]\d+)?)S)?)?'
+)
+
+
+def parse_duration(duration):
+    """Parse an ISO 8601 duration into seconds, or None if it isn't one"""
+    match = _DURATION_RE.fullmatch(duration) if duration else None
+    if match is None or duration[-1] in 'PT':
+        return None
+    years, months, weeks, days, hours, minutes, seconds = match.groups()
+    total = float(seconds.replace(',', '.')) if seconds else 0
+    if minutes:
+        total += int(minutes) * 60
+    if hours:
+        total += int(hours) * 3600
+    if years or months or weeks or days:
+        total += sum(int(value) * unit for value, unit in zip((years, months, weeks, days), _UNIT_SECONDS) if value)
+    return total
+
+
+def regular_flags(details_list, max_short_seconds=DEFAULT_SHORTS_MAX_SECONDS):
+    """Classify a batch of videos.list items: True for regular videos, False for shorts
+
+    Missing items, durations we can't parse and zero durations (live and
+    upcoming streams report P0D) count as regular, so they're never hidden by
+    mistake.
+    """
+    flags = []
+    for details in details_list:
+        seconds = parse_duration((details or {}).get('contentDetails', {}).get('duration', ''))
+        flags.append(not seconds or seconds > max_short_seconds)
+    return flags
+
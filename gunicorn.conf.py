@@ -0,0 +1,13 @@
+"""Gunicorn settings, picked up automatically by `gunicorn app:app`
+
+Pages spend nearly all their time waiting on YouTube, so each worker serves
+requests from a pool of threads (gthread) instead of one at a time: a worker
+with WEB_THREADS threads can have that many families' upstream calls in flight.
+"""
+import os
+
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('WEB_THREADS', 32))
+timeout = int(os.environ.get('WEB_TIMEOUT', 60))
+keepalive = 5
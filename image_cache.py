@@ -0,0 +1,208 @@
+import hashlib
+import io
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    from PIL import Image
+except ImportError:  # In requirements.txt; without it we serve YouTube's own sizes
+    Image = None
+
+from singleflight import SingleFlight, file_lock
+
+logger = logging.getLogger(__name__)
+
+YTIMG_URL = 'https://i.ytimg.com/vi/{video_id}/{variant}.jpg'
+
+# Size name -> (YouTube variant to fetch, width to shrink it to, None to keep it as is)
+THUMBNAIL_SIZES = {
+    'small': ('mqdefault', 240),  # Favorites strip on the home page
+    'medium': ('mqdefault', None),  # 320x180, video grids
+    'large': ('hqdefault', None),  # 480x360
+}
+
+
+def shrink(data, width, quality=80):
+    """Re-encode a JPEG at most `width` pixels wide (unchanged without Pillow)"""
+    if Image is None or width is None:
+        return data
+    with Image.open(io.BytesIO(data)) as image:
+        if image.width <= width:
+            return data
+        height = round(image.height * width / image.width)
+        output = io.BytesIO()
+        image.convert('RGB').resize((width, height), Image.LANCZOS).save(output, 'JPEG', quality=quality,
+                                                                        optimize=True)
+    return output.getvalue()
+
+
+class ImageCache:
+    """On-disk cache of video thumbnails, content-addressed and bounded in size
+
+    Images are stored once per content hash under cache_dir/<ab>/<hash>.jpg, so
+    identical images (a refetch that didn't change, an image several videos
+    share) take space once. A SQLite index maps (video_id, size) to its blob and records when
+    each was last served; past max_bytes the least recently served go first.
+    """
+
+    def __init__(self, cache_dir, http, max_bytes=200 * 1024 * 1024, refresh_after=7 * 86400, timeout=10):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.http = http
+        self.max_bytes = max_bytes
+        self.refresh_after = refresh_after
+        self.timeout = timeout
+        self.db_path = os.path.join(self.cache_dir, 'index.db')
+        self.lock_dir = os.path.join(self.cache_dir, 'locks')
+        self._local = threading.local()
+        self._flights = SingleFlight()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._init_db()
+        if Image is None:
+            logger.warning("Pillow is not installed, 'small' thumbnails are served at full size")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        with self._connect() as conn:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS thumbnails (
+                    video_id TEXT NOT NULL,
+                    size TEXT NOT NULL,
+                    digest TEXT NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    used_at REAL NOT NULL,
+                    PRIMARY KEY (video_id, size)
+                );
+                CREATE INDEX IF NOT EXISTS idx_thumbnails_used ON thumbnails (used_at);
+                CREATE TABLE IF NOT EXISTS blobs (
+                    digest TEXT PRIMARY KEY,
+                    bytes INTEGER NOT NULL
+                );
+            ''')
+
+    def path(self, digest):
+        return os.path.join(self.cache_dir, digest[:2], digest + '.jpg')
+
+    def _lookup(self, video_id, size):
+        row = self._connect().execute(
+            'SELECT digest, fetched_at, used_at FROM thumbnails WHERE video_id = ? AND size = ?',
+            (video_id, size)).fetchone()
+        if row is None or not os.path.exists(self.path(row[0])):
+            return None
+        return row
+
+    def get(self, video_id, size):
+        """Return (path, digest) for a thumbnail, fetching it on first use; None if it can't be had"""
+        row = self._lookup(video_id, size)
+        now = time.time()
+        if row and now - row[1] < self.refresh_after:
+            if now - row[2] > 3600:
+                # Only note use hourly, eviction doesn't need to be more precise than that
+                with self._connect() as conn:
+                    conn.execute('UPDATE thumbnails SET used_at = ? WHERE video_id = ? AND size = ?',
+                                 (now, video_id, size))
+            return self.path(row[0]), row[0]
+
+        digest = self._flights.do((video_id, size), lambda: self._fetch(video_id, size))
+        if digest is None and row:
+            digest = row[0]  # Keep serving the old copy if YouTube is unreachable
+        return (self.path(digest), digest) if digest else None
+
+    def _fetch(self, video_id, size):
+        with file_lock(self.lock_dir, (video_id, size)):
+            # Another worker may have fetched it while we waited
+            row = self._lookup(video_id, size)
+            if row and time.time() - row[1] < self.refresh_after:
+                return row[0]
+
+            variant, width = THUMBNAIL_SIZES[size]
+            try:
+                response = self.http.get(YTIMG_URL.format(video_id=video_id, variant=variant), timeout=self.timeout)
+            except Exception as e:
+                logger.warning("Error fetching thumbnail %s/%s: %s", video_id, size, e)
+                return None
+            if response.status_code != 200:
+                logger.debug("⚠️ Thumbnail %s/%s not available: %s", video_id, size, response.status_code)
+                return None
+
+            try:
+                data = shrink(response.content, width)
+            except Exception as e:
+                logger.warning("Could not resize thumbnail %s: %s", video_id, e)
+                data = response.content
+            digest = self._store_blob(data)
+
+            now = time.time()
+            conn = self._connect()
+            with conn:
+                previous = conn.execute('SELECT digest FROM thumbnails WHERE video_id = ? AND size = ?',
+                                        (video_id, size)).fetchone()
+                conn.execute('''
+                    INSERT OR REPLACE INTO thumbnails (video_id, size, digest, fetched_at, used_at)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (video_id, size, digest, now, now))
+                # A refresh that got different bytes leaves the old image unused
+                if previous and previous[0] != digest:
+                    self._release_blob(conn, previous[0])
+            self._evict(keep=(video_id, size))
+            return digest
+
+    def _store_blob(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO blobs (digest, bytes) VALUES (?, ?)', (digest, len(data)))
+        return digest
+
+    def _release_blob(self, conn, digest):
+        """Delete a blob and its file if no thumbnail uses it any more; returns the bytes freed"""
+        if conn.execute('SELECT 1 FROM thumbnails WHERE digest = ? LIMIT 1', (digest,)).fetchone():
+            return 0
+        row = conn.execute('SELECT bytes FROM blobs WHERE digest = ?', (digest,)).fetchone()
+        conn.execute('DELETE FROM blobs WHERE digest = ?', (digest,))
+        try:
+            os.remove(self.path(digest))
+        except OSError:
+            pass
+        return row[0] if row else 0
+
+    def total_bytes(self):
+        return self._connect().execute('SELECT COALESCE(SUM(bytes), 0) FROM blobs').fetchone()[0]
+
+    def _evict(self, keep=None):
+        """Drop the least recently served thumbnails (except `keep`) until we're under 90% of max_bytes"""
+        total = self.total_bytes()
+        if total <= self.max_bytes:
+            return
+
+        conn = self._connect()
+        target = self.max_bytes * 0.9
+        evicted = 0
+        rows = conn.execute('SELECT video_id, size, digest FROM thumbnails ORDER BY used_at').fetchall()
+        for video_id, size, digest in rows:
+            if total <= target:
+                break
+            if (video_id, size) == keep:
+                continue
+            with conn:
+                conn.execute('DELETE FROM thumbnails WHERE video_id = ? AND size = ?', (video_id, size))
+                total -= self._release_blob(conn, digest)
+            evicted += 1
+        if evicted:
+            logger.info("🧹 Evicted %d thumbnails, image cache is now %.1f MB", evicted, total / 1024 / 1024)
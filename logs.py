@@ -0,0 +1,49 @@
+import atexit
+import itertools
+import logging
+import logging.handlers
+import queue
+import sys
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+_listener = None
+
+
+def setup_logging(level='INFO', fmt=LOG_FORMAT, stream=None):
+    """Send all logging through a queue to a background thread that writes to stdout
+
+    Request threads only put records on the queue, so a slow log collector on
+    the other end of stdout never holds up a page. Safe to call more than once;
+    later calls just change the level.
+    """
+    global _listener
+    root = logging.getLogger()
+    root.setLevel(level)
+    if _listener is not None:
+        return
+
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(logging.Formatter(fmt))
+    records = queue.SimpleQueue()
+    root.handlers = [logging.handlers.QueueHandler(records)]
+    _listener = logging.handlers.QueueListener(records, handler, respect_handler_level=True)
+    _listener.start()
+    # Exit hooks run last-registered first; setting up logging before the app registers its
+    # own hooks means their messages are flushed too
+    atexit.register(_listener.stop)
+
+
+class Sampler:
+    """Lets one call in `every` through, for per-item debug logs inside hot loops
+
+        if logger.isEnabledFor(logging.DEBUG) and sample():
+            logger.debug(...)
+    """
+
+    def __init__(self, every=50):
+        self.every = max(1, every)
+        self._count = itertools.count()
+
+    def __call__(self):
+        return next(self._count) % self.every == 0
@@ -0,0 +1,233 @@
+import bisect
+import contextvars
+import threading
+import time
+from collections import deque
+
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# The trace of the request being handled, if any (copied into executor threads with the context)
+current_trace = contextvars.ContextVar('current_trace', default=None)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (inf if past the last bucket)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class Trace:
+    """One request: its route, timing and the spans (upstream calls, cache lookups) it caused"""
+
+    def __init__(self, route):
+        self.route = route
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.duration = None
+        self.status = None
+        self.spans = []
+
+
+def _labels(**labels):
+    return '{' + ','.join('%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                          for key, value in labels.items()) + '}'
+
+
+class Metrics:
+    """Per-process request, upstream call and cache metrics
+
+    Each request gets a Trace whose spans record the YouTube and DigitalOcean
+    calls and cache lookups it made. Traces are folded into per-route and
+    per-endpoint histograms and counters, and the most recent ones are kept
+    for the admin page. Every gunicorn worker keeps its own numbers.
+    """
+
+    def __init__(self, recent_traces=50, prefix='kidsafe'):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.requests = {}  # route -> Histogram
+        self.responses = {}  # (route, status) -> count
+        self.calls = {}  # (service, endpoint, route) -> Histogram
+        self.call_results = {}  # (service, endpoint, status) -> count
+        self.call_items = {}  # (service, endpoint) -> items requested
+        self.quota_units = {}  # (endpoint, route) -> units
+        self.cache_lookups = {}  # (cache, outcome) -> count
+        self.recent = deque(maxlen=recent_traces)
+        self.started_at = time.time()
+
+    def start_request(self, route):
+        trace = Trace(route)
+        current_trace.set(trace)
+        return trace
+
+    def finish_request(self, status):
+        """Close the current request's trace (a no-op if it's already closed)"""
+        trace = current_trace.get()
+        if trace is None or trace.duration is not None:
+            return
+        trace.duration = time.perf_counter() - trace.started
+        trace.status = status
+        with self._lock:
+            self.requests.setdefault(trace.route, Histogram()).observe(trace.duration)
+            key = (trace.route, status)
+            self.responses[key] = self.responses.get(key, 0) + 1
+            self.recent.append(trace)
+        current_trace.set(None)
+
+    def record_call(self, service, endpoint, route, seconds, status, parts=None, items=None, units=0):
+        """Record one upstream HTTP call"""
+        with self._lock:
+            self.calls.setdefault((service, endpoint, route), Histogram()).observe(seconds)
+            key = (service, endpoint, status)
+            self.call_results[key] = self.call_results.get(key, 0) + 1
+            if items:
+                key = (service, endpoint)
+                self.call_items[key] = self.call_items.get(key, 0) + items
+            if units:
+                key = (endpoint, route)
+                self.quota_units[key] = self.quota_units.get(key, 0) + units
+
+        trace = current_trace.get()
+        if trace is not None:
+            trace.spans.append({'kind': service, 'name': endpoint, 'parts': parts, 'items': items,
+                                'seconds': seconds, 'status': status, 'units': units})
+
+    def record_cache(self, cache, outcome, count=1):
+        """Record cache lookups; outcome is 'hit', 'stale' or 'miss'"""
+        if not count:
+            return
+        with self._lock:
+            key = (cache, outcome)
+            self.cache_lookups[key] = self.cache_lookups.get(key, 0) + count
+
+        trace = current_trace.get()
+        if trace is not None:
+            trace.spans.append({'kind': 'cache', 'name': cache, 'outcome': outcome, 'items': count})
+
+    def summary(self):
+        """Per-route, per-endpoint and per-cache breakdowns for the admin page"""
+        with self._lock:
+            upstream = {}
+            for (service, endpoint, route), histogram in self.calls.items():
+                entry = upstream.setdefault(route, {'calls': 0, 'seconds': 0.0})
+                entry['calls'] += histogram.count
+                entry['seconds'] += histogram.sum
+
+            routes = []
+            for route, histogram in self.requests.items():
+                routes.append({
+                    'route': route,
+                    'requests': histogram.count,
+                    'avg': histogram.sum / histogram.count,
+                    'p50': histogram.quantile(0.5),
+                    'p95': histogram.quantile(0.95),
+                    'errors': sum(count for (r, status), count in self.responses.items()
+                                  if r == route and status >= 500),
+                    'upstream_calls': upstream.get(route, {}).get('calls', 0),
+                    # Summed over calls, so it can exceed the request time when calls overlap
+                    'upstream_seconds': upstream.get(route, {}).get('seconds', 0.0),
+                    'total_seconds': histogram.sum,
+                    'quota_units': sum(units for (_, r), units in self.quota_units.items() if r == route),
+                })
+            routes.sort(key=lambda entry: entry['total_seconds'], reverse=True)
+
+            endpoints = {}
+            for (service, endpoint, route), histogram in self.calls.items():
+                entry = endpoints.setdefault((service, endpoint), Histogram())
+                entry.counts = [a + b for a, b in zip(entry.counts, histogram.counts)]
+                entry.sum += histogram.sum
+                entry.count += histogram.count
+            calls = [{
+                'service': service,
+                'endpoint': endpoint,
+                'calls': histogram.count,
+                'errors': sum(count for (s, e, status), count in self.call_results.items()
+                              if (s, e) == (service, endpoint) and status != 200),
+                'avg': histogram.sum / histogram.count,
+                'p95': histogram.quantile(0.95),
+                'items_requested': self.call_items.get((service, endpoint), 0),
+                'quota_units': sum(units for (e, _), units in self.quota_units.items() if e == endpoint)
+                               if service == 'youtube' else 0,
+            } for (service, endpoint), histogram in endpoints.items()]
+            calls.sort(key=lambda entry: entry['calls'], reverse=True)
+
+            caches = {}
+            for (cache, outcome), count in self.cache_lookups.items():
+                caches.setdefault(cache, {'cache': cache, 'hit': 0, 'stale': 0, 'miss': 0})[outcome] = count
+            for entry in caches.values():
+                lookups = entry['hit'] + entry['stale'] + entry['miss']
+                entry['hit_ratio'] = (entry['hit'] + entry['stale']) / lookups if lookups else 0
+
+            slowest = sorted(self.recent, key=lambda trace: trace.duration, reverse=True)[:10]
+
+        return {
+            'uptime': time.time() - self.started_at,
+            'routes': routes,
+            'calls': calls,
+            'caches': sorted(caches.values(), key=lambda entry: entry['cache']),
+            'slowest': slowest,
+        }
+
+    def prometheus(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+
+        def histogram(name, help_text, histograms):
+            lines.append(f'# HELP {self.prefix}_{name} {help_text}')
+            lines.append(f'# TYPE {self.prefix}_{name} histogram')
+            for labels, values in histograms:
+                cumulative = 0
+                for bound, count in zip(values.buckets + (float('inf'),), values.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{self.prefix}_{name}_bucket{_labels(**labels, le=le)} {cumulative}')
+                lines.append(f'{self.prefix}_{name}_sum{_labels(**labels)} {values.sum}')
+                lines.append(f'{self.prefix}_{name}_count{_labels(**labels)} {values.count}')
+
+        def counter(name, help_text, values):
+            lines.append(f'# HELP {self.prefix}_{name} {help_text}')
+            lines.append(f'# TYPE {self.prefix}_{name} counter')
+            for labels, value in values:
+                lines.append(f'{self.prefix}_{name}{_labels(**labels)} {value}')
+
+        with self._lock:
+            histogram('request_duration_seconds', 'Time to handle a request, by route.',
+                      [({'route': route}, h) for route, h in self.requests.items()])
+            counter('responses_total', 'Responses sent, by route and status.',
+                    [({'route': route, 'status': status}, count)
+                     for (route, status), count in self.responses.items()])
+            histogram('upstream_call_duration_seconds', 'Time spent in upstream HTTP calls.',
+                      [({'service': s, 'endpoint': e, 'route': r}, h) for (s, e, r), h in self.calls.items()])
+            counter('upstream_calls_total', 'Upstream HTTP calls, by result.',
+                    [({'service': s, 'endpoint': e, 'status': status}, count)
+                     for (s, e, status), count in self.call_results.items()])
+            counter('upstream_items_total', 'Items requested from upstream (IDs or page size).',
+                    [({'service': s, 'endpoint': e}, count) for (s, e), count in self.call_items.items()])
+            counter('youtube_quota_units_total', 'YouTube Data API quota units spent by this process.',
+                    [({'endpoint': e, 'route': r}, units) for (e, r), units in self.quota_units.items()])
+            counter('cache_lookups_total', 'Cache lookups, by cache and outcome.',
+                    [({'cache': c, 'outcome': o}, count) for (c, o), count in self.cache_lookups.items()])
+
+        return '\n'.join(lines) + '\n'
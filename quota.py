@@ -0,0 +1,135 @@
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+try:
+    from zoneinfo import ZoneInfo
+    QUOTA_TIMEZONE = ZoneInfo('America/Los_Angeles')  # YouTube quotas reset at midnight Pacific
+except Exception:
+    QUOTA_TIMEZONE = timezone.utc
+
+logger = logging.getLogger(__name__)
+
+# Quota units charged per call, by YouTube Data API endpoint
+ENDPOINT_COSTS = {
+    'search': 100,
+    'videos': 1,
+    'playlists': 1,
+    'playlistItems': 1,
+    'channels': 1,
+}
+
+
+def quota_day():
+    """The quota day we're in (YouTube's day, not the server's)"""
+    return datetime.now(QUOTA_TIMEZONE).date().isoformat()
+
+
+class QuotaLedger:
+    """Records the quota units spent per day, route and endpoint, and decides what we can afford
+
+    Usage is kept in a SQLite file so every worker (and the background jobs)
+    draw from the same daily budget. Calls are split into essential ones (the
+    data a page needs) and optional ones (shorts double-checks, thumbnail
+    refreshes, background revalidation). Once less than `reserve` of the day's
+    budget is left, optional calls are refused so the remainder goes to pages.
+    """
+
+    def __init__(self, db_path, daily_limit=10000, reserve=0.2):
+        self.db_path = db_path
+        self.daily_limit = daily_limit
+        self.reserve = reserve
+        self._local = threading.local()
+        self._exhausted_day = None
+        self._init_db()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS quota_usage (
+                    day TEXT NOT NULL,
+                    route TEXT NOT NULL,
+                    endpoint TEXT NOT NULL,
+                    calls INTEGER NOT NULL DEFAULT 0,
+                    units INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (day, route, endpoint)
+                )
+            ''')
+
+    def cost(self, endpoint):
+        return ENDPOINT_COSTS.get(endpoint, 1)
+
+    def record(self, endpoint, route='background'):
+        """Charge one call to endpoint against today's budget"""
+        try:
+            with self._connect() as conn:
+                conn.execute('''
+                    INSERT INTO quota_usage (day, route, endpoint, calls, units) VALUES (?, ?, ?, 1, ?)
+                    ON CONFLICT (day, route, endpoint) DO UPDATE SET
+                        calls = calls + 1, units = units + excluded.units
+                ''', (quota_day(), route, endpoint, self.cost(endpoint)))
+        except sqlite3.Error as e:
+            logger.warning("Could not record quota usage: %s", e)
+
+    def mark_exhausted(self):
+        """YouTube said we're out of quota; stop calling it until the day rolls over"""
+        self._exhausted_day = quota_day()
+
+    def used_today(self):
+        try:
+            row = self._connect().execute(
+                'SELECT COALESCE(SUM(units), 0) FROM quota_usage WHERE day = ?', (quota_day(),)).fetchone()
+            return row[0]
+        except sqlite3.Error:
+            return 0
+
+    def remaining(self):
+        if self._exhausted_day == quota_day():
+            return 0
+        return max(0, self.daily_limit - self.used_today())
+
+    def allow(self, endpoint, optional=False):
+        """Can we afford a call to endpoint? Optional calls must leave the reserve untouched"""
+        remaining = self.remaining() - self.cost(endpoint)
+        if optional:
+            return remaining >= self.daily_limit * self.reserve
+        return remaining >= 0
+
+    def usage(self, day=None):
+        """Usage summary for a day: totals plus breakdowns by route and endpoint"""
+        day = day or quota_day()
+        rows = self._connect().execute(
+            'SELECT route, endpoint, calls, units FROM quota_usage WHERE day = ? ORDER BY units DESC',
+            (day,)).fetchall()
+
+        by_route = {}
+        by_endpoint = {}
+        for route, endpoint, calls, units in rows:
+            for totals, key in ((by_route, route), (by_endpoint, endpoint)):
+                entry = totals.setdefault(key, {'calls': 0, 'units': 0})
+                entry['calls'] += calls
+                entry['units'] += units
+
+        used = sum(units for _, _, _, units in rows)
+        return {
+            'day': day,
+            'limit': self.daily_limit,
+            'used': used,
+            'remaining': self.remaining() if day == quota_day() else max(0, self.daily_limit - used),
+            'by_route': by_route,
+            'by_endpoint': by_endpoint,
+        }
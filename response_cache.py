@@ -0,0 +1,223 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from singleflight import SingleFlight, file_lock
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """LRU cache of API responses with a TTL and a stale-while-revalidate window
+
+    Entries younger than `ttl` are fresh. Entries older than that but younger
+    than `ttl + stale_ttl` are served as-is while a background refresh fetches
+    a new copy. Anything older is fetched on the request path.
+
+    With a db_path, entries are also written to a SQLite file so other
+    processes (other workers, the prefetch worker) can fill and share them.
+    Values must then be JSON-serializable. Each write also trims this cache's
+    rows there to the newest `max_items` still inside the stale window.
+
+    Concurrent misses for the same key share one fetch: within a process
+    through SingleFlight, and across processes through a lock file next to
+    the database, after which the waiter re-reads the shared copy.
+    """
+
+    def __init__(self, max_items=500, ttl=3600, stale_ttl=86400, name='cache', db_path=None, metrics=None):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.name = name
+        self.db_path = db_path
+        self.metrics = metrics
+        self.lock_dir = db_path + '.locks' if db_path else None
+        self._flights = SingleFlight()
+        self._entries = OrderedDict()  # key -> (value, stored_at)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.hits = self.stale_hits = self.misses = 0
+        if db_path:
+            self._init_db()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS responses (
+                    cache TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    stored_at REAL NOT NULL,
+                    PRIMARY KEY (cache, key)
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_responses_stored_at ON responses (cache, stored_at)')
+
+    def _load_shared(self, key):
+        """Read key from the shared SQLite file into memory; returns (value, stored_at) or None"""
+        try:
+            row = self._connect().execute(
+                'SELECT value, stored_at FROM responses WHERE cache = ? AND key = ?',
+                (self.name, json.dumps(key))).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("%s cache read failed: %s", self.name, e)
+            return None
+        if row is None:
+            return None
+        entry = (json.loads(row[0]), row[1])
+        self._remember(key, entry)
+        return entry
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+
+    def _entry(self, key):
+        """(value, stored_at) for key, or None if missing or past the stale window"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        # Another process may have stored a newer copy than our stale one
+        if self.db_path and (entry is None or time.time() - entry[1] >= self.ttl):
+            shared = self._load_shared(key)
+            if shared is not None and (entry is None or shared[1] > entry[1]):
+                entry = shared
+
+        if entry is None:
+            return None
+        if time.time() - entry[1] >= self.ttl + self.stale_ttl:
+            self.delete(key)
+            return None
+        return entry
+
+    def get(self, key):
+        """Return (value, age_in_seconds), or (None, None) if missing or past the stale window"""
+        entry = self._entry(key)
+        if entry is None:
+            return None, None
+        return entry[0], time.time() - entry[1]
+
+    def fresh_version(self, key, ahead=0):
+        """When key's entry was stored, or None unless it's fresh (and still will be in `ahead` seconds)
+
+        The version changes whenever the value is refetched.
+        """
+        entry = self._entry(key)
+        if entry is None or time.time() + ahead - entry[1] >= self.ttl:
+            return None
+        return entry[1]
+
+    def set(self, key, value):
+        stored_at = time.time()
+        self._remember(key, (value, stored_at))
+        if self.db_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute('INSERT OR REPLACE INTO responses (cache, key, value, stored_at) VALUES (?, ?, ?, ?)',
+                                 (self.name, json.dumps(key), json.dumps(value), stored_at))
+                    self._evict_shared(conn, stored_at)
+            except sqlite3.Error as e:
+                logger.warning("%s cache write failed: %s", self.name, e)
+
+    def _evict_shared(self, conn, now):
+        """Drop this cache's rows that are past the stale window or beyond the newest max_items"""
+        conn.execute('''
+            DELETE FROM responses WHERE cache = ? AND (stored_at < ? OR key IN (
+                SELECT key FROM responses WHERE cache = ? ORDER BY stored_at DESC LIMIT -1 OFFSET ?
+            ))
+        ''', (self.name, now - self.ttl - self.stale_ttl, self.name, self.max_items))
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.db_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute('DELETE FROM responses WHERE cache = ? AND key = ?', (self.name, json.dumps(key)))
+            except sqlite3.Error as e:
+                logger.warning("%s cache delete failed: %s", self.name, e)
+
+    def _fetch_and_store(self, key, fetch):
+        with file_lock(self.lock_dir, (self.name, key)) as locked:
+            if locked and self.db_path:
+                # Another process may have fetched it while we waited for the lock
+                value, age = self.get(key)
+                if age is not None and age < self.ttl:
+                    return value
+            value = fetch()
+            if value is not None:
+                self.set(key, value)
+            return value
+
+    def _refresh(self, key, fetch):
+        try:
+            # Only one process refreshes a given entry; the rest keep serving the stale copy
+            with file_lock(self.lock_dir, (self.name, key), timeout=0) as locked:
+                if locked:
+                    value, age = self.get(key)
+                    if age is None or age >= self.ttl:
+                        value = fetch()
+                        if value is not None:
+                            self.set(key, value)
+        except Exception as e:
+            logger.error("Error refreshing %s entry %s: %s", self.name, key, e)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def refresh_in_background(self, key, fetch):
+        """Start a background refresh for key unless one is already running"""
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        threading.Thread(target=self._refresh, args=(key, fetch), daemon=True,
+                         name=f'{self.name}-refresh').start()
+
+    def _record(self, outcome):
+        if self.metrics:
+            self.metrics.record_cache(self.name, outcome)
+
+    def get_or_fetch(self, key, fetch, allow_refresh=True):
+        """Return the cached value for key, calling fetch() on a miss
+
+        A stale hit is returned immediately and refreshed in the background
+        (unless allow_refresh is False). None results are not cached.
+        """
+        value, age = self.get(key)
+        if age is not None and age < self.ttl:
+            self.hits += 1
+            self._record('hit')
+            return value
+        if age is not None:
+            self.stale_hits += 1
+            self._record('stale')
+            if allow_refresh:
+                self.refresh_in_background(key, fetch)
+            return value
+
+        self.misses += 1
+        self._record('miss')
+        return self._flights.do(key, lambda: self._fetch_and_store(key, fetch))
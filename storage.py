@@ -0,0 +1,339 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def empty_favorites():
+    """Default favorites if nothing exists"""
+    return {
+        'playlists': [],
+        'channels': [],
+        'watch_history': []
+    }
+
+
+class FavoritesStore:
+    """Base class for favorites backends
+
+    Subclasses must implement load(), save() and version(). The granular
+    operations below fall back to load/modify/save; backends that can update a
+    single row override them so concurrent writers don't clobber each other.
+    """
+
+    # Bumped on every write made through this process, so snapshots notice at once
+    local_writes = 0
+
+    def load(self):
+        raise NotImplementedError
+
+    def version(self):
+        """Cheap token that changes whenever the stored data changes, from any process"""
+        raise NotImplementedError
+
+    def save(self, favorites):
+        raise NotImplementedError
+
+    def add_item(self, kind, item):
+        """Add a playlist or channel (kind is 'playlists' or 'channels'); False if it already exists"""
+        favorites = self.load()
+        if any(existing['id'] == item['id'] for existing in favorites[kind]):
+            return False
+        favorites[kind].append(item)
+        self.save(favorites)
+        return True
+
+    def remove_item(self, kind, item_id):
+        """Remove a playlist or channel by ID"""
+        favorites = self.load()
+        favorites[kind] = [existing for existing in favorites[kind] if existing['id'] != item_id]
+        self.save(favorites)
+
+    def set_thumbnails(self, playlist_thumbnails, channel_thumbnails):
+        """Store resolved artwork, given {id: url} for playlists and channels ('' for none)"""
+        favorites = self.load()
+        for playlist in favorites['playlists']:
+            if playlist_thumbnails.get(playlist['id']) is not None:
+                playlist['thumbnail'] = playlist_thumbnails[playlist['id']]
+        for channel in favorites['channels']:
+            if channel_thumbnails.get(channel['id']) is not None:
+                channel['video_thumbnail'] = channel_thumbnails[channel['id']]
+        self.save(favorites)
+
+    def saved_watch_history(self, default_profile):
+        """Watch history stored with the favorites, as {profile: items}, most recent first
+
+        FAVORITES_DATA keeps the default profile's history under 'watch_history'
+        and any others under 'watch_history_profiles'. Only used to seed the
+        watch history log (see watch_history.py), which records plays from then on.
+        """
+        favorites = self.load()
+        histories = {default_profile: favorites.get('watch_history', [])}
+        histories.update(favorites.get('watch_history_profiles') or {})
+        return histories
+
+
+class JSONFavoritesStore(FavoritesStore):
+    """Favorites as one JSON document, from the FAVORITES_DATA env var or a file"""
+
+    def __init__(self, path, env_var='FAVORITES_DATA'):
+        self.path = path
+        self.env_var = env_var
+
+    def load(self):
+        # Try to load from environment variable first (for production)
+        favorites_env = os.environ.get(self.env_var)
+        if favorites_env:
+            try:
+                # Decode base64 and parse JSON
+                favorites_json = base64.b64decode(favorites_env).decode('utf-8')
+                return json.loads(favorites_json)
+            except Exception:
+                pass
+
+        # Fallback to file (for local development)
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except Exception:
+            return empty_favorites()
+
+    def version(self):
+        try:
+            stat = os.stat(self.path)
+            file_version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            file_version = None
+        # A stable digest (not hash()) so every worker computes the same version
+        env_value = os.environ.get(self.env_var)
+        env_version = hashlib.sha1(env_value.encode()).hexdigest() if env_value else None
+        return env_version, file_version
+
+    def save(self, favorites):
+        self.local_writes += 1
+        try:
+            with open(self.path, 'w') as f:
+                json.dump(favorites, f, indent=2)
+        except Exception as e:
+            logger.warning("Could not save to file: %s", e)
+
+        # Keep this process's copy of the env var current so it sees its own writes
+        if os.environ.get(self.env_var):
+            favorites_json = json.dumps(favorites)
+            os.environ[self.env_var] = base64.b64encode(favorites_json.encode('utf-8')).decode('utf-8')
+
+
+class SQLiteFavoritesStore(FavoritesStore):
+    """Favorites in SQLite (WAL mode), one table each for playlists and channels
+
+    On first open the database is seeded from `seed_store` (the old JSON/base64
+    format), once, so existing favorites carry over. Watch history lives in its
+    own store; the history saved in `seed_store` is only read to seed it.
+    """
+
+    COLUMNS = {
+        'playlists': ('id', 'title', 'description', 'thumbnail'),
+        'channels': ('id', 'title', 'description', 'thumbnail', 'video_thumbnail'),
+    }
+
+    def __init__(self, db_path, seed_store=None):
+        self.db_path = db_path
+        self.seed_store = seed_store
+        self._local = threading.local()
+        self._init_db()
+        if seed_store is not None:
+            self._migrate(seed_store)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        self.local_writes += 1
+        return _Transaction(self._connect())
+
+    def _init_db(self):
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS playlists (
+                position INTEGER PRIMARY KEY AUTOINCREMENT,
+                id TEXT NOT NULL UNIQUE,
+                title TEXT,
+                description TEXT,
+                thumbnail TEXT
+            );
+            CREATE TABLE IF NOT EXISTS channels (
+                position INTEGER PRIMARY KEY AUTOINCREMENT,
+                id TEXT NOT NULL UNIQUE,
+                title TEXT,
+                description TEXT,
+                thumbnail TEXT,
+                video_thumbnail TEXT
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+        ''')
+
+    def version(self):
+        row = self._connect().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return row[0] if row else None
+
+    def _migrate(self, seed_store):
+        """Import the old JSON/base64 favorites the first time this database is opened"""
+        with self._transaction() as conn:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_from_json'").fetchone():
+                return
+            favorites = seed_store.load()
+            self._replace_all(conn, favorites)
+            conn.execute("INSERT INTO meta (key, value) VALUES ('migrated_from_json', datetime('now'))")
+        logger.info("📦 Migrated %d playlists and %d channels to %s",
+                    len(favorites.get('playlists', [])), len(favorites.get('channels', [])), self.db_path)
+
+    def _insert(self, conn, kind, item):
+        columns = self.COLUMNS[kind]
+        cursor = conn.execute(
+            f"INSERT OR IGNORE INTO {kind} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            [item.get(column) for column in columns])
+        return cursor.rowcount > 0
+
+    def _select(self, conn, kind, order_by):
+        sql = f"SELECT {', '.join(self.COLUMNS[kind])} FROM {kind} ORDER BY {order_by}"
+        return [dict(row) for row in conn.execute(sql)]
+
+    def _replace_all(self, conn, favorites):
+        for kind in self.COLUMNS:
+            conn.execute(f"DELETE FROM {kind}")
+        for kind in self.COLUMNS:
+            for item in favorites.get(kind, []):
+                self._insert(conn, kind, item)
+
+    def load(self):
+        conn = self._connect()
+        return {
+            'playlists': self._select(conn, 'playlists', 'position'),
+            'channels': self._select(conn, 'channels', 'position'),
+        }
+
+    def save(self, favorites):
+        with self._transaction() as conn:
+            self._replace_all(conn, favorites)
+
+    def add_item(self, kind, item):
+        with self._transaction() as conn:
+            return self._insert(conn, kind, item)
+
+    def remove_item(self, kind, item_id):
+        with self._transaction() as conn:
+            conn.execute(f"DELETE FROM {kind} WHERE id = ?", (item_id,))
+
+    def set_thumbnails(self, playlist_thumbnails, channel_thumbnails):
+        with self._transaction() as conn:
+            conn.executemany("UPDATE playlists SET thumbnail = ? WHERE id = ?",
+                             [(url, item_id) for item_id, url in playlist_thumbnails.items() if url is not None])
+            conn.executemany("UPDATE channels SET video_thumbnail = ? WHERE id = ?",
+                             [(url, item_id) for item_id, url in channel_thumbnails.items() if url is not None])
+
+    def saved_watch_history(self, default_profile):
+        return self.seed_store.saved_watch_history(default_profile) if self.seed_store else {}
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK around a block, for autocommit connections"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            # Every committed write bumps the version other processes poll
+            self.conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+            self.conn.execute('COMMIT')
+        else:
+            self.conn.execute('ROLLBACK')
+        return False
+
+
+class FavoritesSnapshot:
+    """In-process copy of the favorites, reloaded only when the store changes
+
+    Writes from this process invalidate it immediately; writes from other
+    workers are picked up by polling store.version() at most once per
+    check_interval seconds. The returned favorites are shared between
+    requests, so treat them as read-only.
+    """
+
+    def __init__(self, store, check_interval=1.0):
+        self.store = store
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._favorites = None
+        self._by_id = {'playlists': {}, 'channels': {}}
+        self._version = None
+        self._local_writes = None
+        self._checked_at = 0
+
+    def _refresh(self):
+        now = time.monotonic()
+        if (self._favorites is not None
+                and self._local_writes == self.store.local_writes
+                and now - self._checked_at < self.check_interval):
+            return
+
+        with self._lock:
+            local_writes = self.store.local_writes
+            version = self.store.version()
+            if self._favorites is None or version != self._version or local_writes != self._local_writes:
+                favorites = self.store.load()
+                self._by_id = {kind: {item['id']: item for item in favorites.get(kind, [])}
+                               for kind in ('playlists', 'channels')}
+                self._favorites = favorites
+                self._version = version
+            self._local_writes = local_writes
+            self._checked_at = now
+
+    def get(self):
+        """Return the current favorites"""
+        self._refresh()
+        return self._favorites
+
+    def version(self):
+        """The store version the current favorites were loaded from"""
+        self._refresh()
+        return self._version
+
+    def find(self, kind, item_id):
+        """Look up a playlist or channel by ID (kind is 'playlists' or 'channels')"""
+        self._refresh()
+        return self._by_id[kind].get(item_id)
+
+
+def create_store(backend, db_path, json_path):
+    """Build the configured favorites backend ('sqlite' or 'json')"""
+    json_store = JSONFavoritesStore(json_path)
+    if backend == 'json':
+        return json_store
+    if backend == 'sqlite':
+        return SQLiteFavoritesStore(db_path, seed_store=json_store)
+    raise ValueError(f"Unknown FAVORITES_BACKEND: {backend}")
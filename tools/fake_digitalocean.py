@@ -0,0 +1,75 @@
+"""Local stand-in for the DigitalOcean Apps API, for testing favorites sync
+
+Serves just the two calls update_digitalocean_env_var makes:
+
+    GET /v2/apps/<app_id>   returns the stored app spec
+    PUT /v2/apps/<app_id>   replaces the spec and counts a "deployment"
+
+Run it and point the app at it:
+
+    python tools/fake_digitalocean.py --port 8081 --fail-first 2
+    DO_API_BASE=http://localhost:8081/v2 DO_API_TOKEN=test DO_APP_ID=test python app.py
+
+GET /deployments shows how many redeploys the app would have triggered.
+"""
+import argparse
+import copy
+import threading
+
+from flask import Flask, jsonify, request
+
+fake_do = Flask(__name__)
+
+state = {
+    'spec': {'name': 'kid-safe-youtube', 'services': [{'name': 'web', 'envs': []}]},
+    'deployments': 0,
+    'fail_remaining': 0,
+}
+state_lock = threading.Lock()
+
+
+def maybe_fail():
+    """Return an error response while injected failures remain"""
+    with state_lock:
+        if state['fail_remaining'] > 0:
+            state['fail_remaining'] -= 1
+            return jsonify({'id': 'service_unavailable', 'message': 'injected failure'}), 503
+    return None
+
+
+@fake_do.route('/v2/apps/<app_id>', methods=['GET'])
+def get_app(app_id):
+    failure = maybe_fail()
+    if failure:
+        return failure
+    with state_lock:
+        return jsonify({'app': {'id': app_id, 'spec': copy.deepcopy(state['spec'])}})
+
+
+@fake_do.route('/v2/apps/<app_id>', methods=['PUT'])
+def update_app(app_id):
+    failure = maybe_fail()
+    if failure:
+        return failure
+    spec = request.get_json()['spec']
+    with state_lock:
+        state['spec'] = spec
+        state['deployments'] += 1
+        print(f"🚀 Deployment #{state['deployments']} for app {app_id}")
+        return jsonify({'app': {'id': app_id, 'spec': spec}})
+
+
+@fake_do.route('/deployments')
+def deployments():
+    with state_lock:
+        return jsonify({'deployments': state['deployments']})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--fail-first', type=int, default=0,
+                        help='answer the first N requests with 503 to exercise retries')
+    args = parser.parse_args()
+    state['fail_remaining'] = args.fail_first
+    fake_do.run(host='127.0.0.1', port=args.port)
@@ -0,0 +1,236 @@
+"""Local stand-in for the YouTube Data API, for benchmarks and offline testing
+
+Serves the endpoints the app uses (search, videos, playlistItems, playlists,
+channels) under /youtube/v3. Responses come from a fixtures file when one
+has a recorded answer for the request, and are otherwise synthesized
+deterministically from the IDs asked for, so any favorites set works:
+
+    PL...   playlists of --videos-per-playlist videos
+    UC...   channels whose uploads playlist (UU...) has --videos-per-channel videos
+    videos  about a quarter are Shorts (under a minute), one in twenty isn't embeddable
+
+Run it and point the app at it:
+
+    python tools/fake_youtube.py --port 8082 --latency-ms 80 --quota 10000
+    YOUTUBE_API_BASE=http://localhost:8082/youtube/v3 YOUTUBE_API_KEY=test python app.py
+
+Record real responses to replay later (the API key is not stored):
+
+    python tools/fake_youtube.py --record fixtures.json
+    python tools/fake_youtube.py --fixtures fixtures.json
+
+GET /stats shows calls and quota units served; POST /stats/reset clears them.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import zlib
+
+import requests
+from flask import Flask, jsonify, request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from quota import ENDPOINT_COSTS  # noqa: E402
+
+REAL_API_BASE = 'https://www.googleapis.com/youtube/v3'
+
+fake_yt = Flask(__name__)
+
+config = {
+    'latency': 0.0,  # seconds added to every response
+    'jitter': 0.0,
+    'quota': None,  # units to serve before answering quotaExceeded
+    'quota_error_rate': 0.0,  # chance of a spurious quotaExceeded
+    'videos_per_playlist': 60,
+    'videos_per_channel': 300,
+    'fixtures': {},
+    'record_path': None,
+}
+stats = {'calls': {}, 'units': 0, 'quota_errors': 0}
+state_lock = threading.Lock()
+
+
+def number(value):
+    """Stable number for an ID or query"""
+    return zlib.crc32(value.encode())
+
+
+def video_id(n):
+    return f'v{n % 10 ** 10:010d}'
+
+
+def snippet(n, title_prefix='Video', **extra):
+    vid = video_id(n)
+    return dict({
+        'title': f'{title_prefix} {n}',
+        'description': f'Description of {title_prefix.lower()} {n}. ' * 3,
+        'channelTitle': f'Channel {n % 97}',
+        'channelId': f'UC{n % 97}',
+        'publishedAt': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(1700000000 - (n % 100000) * 3600)),
+        'thumbnails': {size: {'url': f'https://i.ytimg.com/vi/{vid}/{name}.jpg'}
+                       for size, name in (('default', 'default'), ('medium', 'mqdefault'), ('high', 'hqdefault'))},
+    }, **extra)
+
+
+def page(total, params, make_item):
+    """One page of a token-paged listing; tokens are plain offsets"""
+    per_page = min(int(params.get('maxResults', 5)), 50)
+    start = int(params.get('pageToken') or 0)
+    data = {
+        'items': [make_item(i) for i in range(start, min(start + per_page, total))],
+        'pageInfo': {'totalResults': total, 'resultsPerPage': per_page},
+    }
+    if start + per_page < total:
+        data['nextPageToken'] = str(start + per_page)
+    return data
+
+
+def synthesize(endpoint, params):
+    if endpoint == 'search':
+        base = number(params.get('q', ''))
+        return page(200, params, lambda i: {
+            'kind': 'youtube#searchResult',
+            'id': {'kind': 'youtube#video', 'videoId': video_id(base + i)},
+            'snippet': snippet(base + i),
+        })
+
+    if endpoint == 'videos':
+        parts = params.get('part', '').split(',')
+        items = []
+        for vid in params.get('id', '').split(','):
+            n = int(vid[1:]) if vid[1:].isdigit() else number(vid)
+            item = {'kind': 'youtube#video', 'id': vid}
+            if 'contentDetails' in parts:
+                item['contentDetails'] = {'duration': f'PT{20 + n % 40}S' if n % 4 == 0
+                                          else f'PT{2 + n % 20}M{n % 60}S'}
+            if 'status' in parts:
+                item['status'] = {'embeddable': n % 20 != 7, 'privacyStatus': 'public'}
+            if 'snippet' in parts:
+                item['snippet'] = snippet(n)
+            items.append(item)
+        return {'items': items}
+
+    if endpoint == 'playlistItems':
+        playlist_id = params.get('playlistId', '')
+        base = number(playlist_id)
+        total = config['videos_per_channel'] if playlist_id.startswith('UU') else config['videos_per_playlist']
+        return page(total, params, lambda i: {
+            'kind': 'youtube#playlistItem',
+            'snippet': snippet(base + i, playlistId=playlist_id, position=i,
+                               resourceId={'kind': 'youtube#video', 'videoId': video_id(base + i)}),
+        })
+
+    if endpoint == 'playlists':
+        channel_id = params.get('channelId', '')
+        base = number(channel_id)
+        return page(12, params, lambda i: {
+            'kind': 'youtube#playlist',
+            'id': f'PL{channel_id}{i}',
+            'snippet': snippet(base + i, title_prefix='Playlist'),
+        })
+
+    if endpoint == 'channels':
+        ids = params.get('id') or params.get('forUsername') or params.get('forHandle') or ''
+        return {'items': [{
+            'kind': 'youtube#channel',
+            'id': channel_id,
+            'snippet': snippet(number(channel_id), title_prefix='Channel'),
+            'contentDetails': {'relatedPlaylists': {'uploads': 'UU' + channel_id[2:]}},
+        } for channel_id in ids.split(',') if channel_id]}
+
+    return None
+
+
+def fixture_key(endpoint, params):
+    return endpoint + '?' + '&'.join(f'{key}={params[key]}' for key in sorted(params) if key != 'key')
+
+
+def quota_exceeded():
+    return jsonify({'error': {'code': 403, 'message': 'quota exceeded', 'errors': [
+        {'domain': 'youtube.quota', 'reason': 'quotaExceeded'}]}}), 403
+
+
+@fake_yt.route('/youtube/v3/<endpoint>')
+def api(endpoint):
+    params = request.args.to_dict()
+    cost = ENDPOINT_COSTS.get(endpoint, 1)
+
+    with state_lock:
+        stats['calls'][endpoint] = stats['calls'].get(endpoint, 0) + 1
+        over_budget = config['quota'] is not None and stats['units'] + cost > config['quota']
+        if over_budget or random.random() < config['quota_error_rate']:
+            stats['quota_errors'] += 1
+            return quota_exceeded()
+        stats['units'] += cost
+
+    if config['latency'] or config['jitter']:
+        time.sleep(config['latency'] + random.uniform(0, config['jitter']))
+
+    key = fixture_key(endpoint, params)
+    if config['record_path']:
+        response = requests.get(f'{REAL_API_BASE}/{endpoint}', params=params, timeout=10)
+        if response.status_code == 200:
+            with state_lock:
+                config['fixtures'][key] = response.json()
+                with open(config['record_path'], 'w') as f:
+                    json.dump(config['fixtures'], f, indent=1)
+        return response.content, response.status_code, {'Content-Type': 'application/json'}
+
+    data = config['fixtures'].get(key) or synthesize(endpoint, params)
+    if data is None:
+        return jsonify({'error': {'code': 404, 'message': f'unknown endpoint {endpoint}'}}), 404
+    return jsonify(data)
+
+
+@fake_yt.route('/stats')
+def get_stats():
+    with state_lock:
+        return jsonify(stats)
+
+
+@fake_yt.route('/stats/reset', methods=['POST'])
+def reset_stats():
+    with state_lock:
+        stats['calls'] = {}
+        stats['units'] = 0
+        stats['quota_errors'] = 0
+    return jsonify(stats)
+
+
+def configure(latency_ms=0, jitter_ms=0, quota=None, quota_error_rate=0.0, videos_per_playlist=60,
+              videos_per_channel=300, fixtures=None, record=None):
+    config.update({
+        'latency': latency_ms / 1000,
+        'jitter': jitter_ms / 1000,
+        'quota': quota,
+        'quota_error_rate': quota_error_rate,
+        'videos_per_playlist': videos_per_playlist,
+        'videos_per_channel': videos_per_channel,
+        'record_path': record,
+    })
+    if fixtures:
+        with open(fixtures) as f:
+            config['fixtures'] = json.load(f)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8082)
+    parser.add_argument('--latency-ms', type=float, default=0, help='delay added to every response')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='extra random delay, up to this much')
+    parser.add_argument('--quota', type=int, default=None, help='units to serve before answering quotaExceeded')
+    parser.add_argument('--quota-error-rate', type=float, default=0.0,
+                        help='fraction of calls answered with a spurious quotaExceeded')
+    parser.add_argument('--videos-per-playlist', type=int, default=60)
+    parser.add_argument('--videos-per-channel', type=int, default=300)
+    parser.add_argument('--fixtures', help='JSON file of recorded responses to replay')
+    parser.add_argument('--record', help='proxy to the real API and save its responses to this file')
+    args = parser.parse_args()
+    configure(args.latency_ms, args.jitter_ms, args.quota, args.quota_error_rate, args.videos_per_playlist,
+              args.videos_per_channel, args.fixtures, args.record)
+    fake_yt.run(host='127.0.0.1', port=args.port, threaded=True)
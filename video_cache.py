@@ -0,0 +1,190 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Fields we keep per video, and how long each stays fresh (seconds, None = forever)
+# Durations never change, so shorts classification is a permanent hit once seen
+DEFAULT_TTLS = {
+    'duration': None,
+    'embeddable': 6 * 3600,
+    'title': 24 * 3600,
+    'channel': 24 * 3600,
+    'thumbnail': 24 * 3600,
+}
+
+# Which cached fields are needed to answer each videos.list part
+PART_FIELDS = {
+    'contentDetails': ('duration',),
+    'status': ('embeddable',),
+    'snippet': ('title', 'channel', 'thumbnail'),
+}
+
+
+def fields_from_item(item):
+    """Pull the cacheable fields out of a videos.list item"""
+    fields = {}
+    if 'contentDetails' in item:
+        fields['duration'] = item['contentDetails'].get('duration', '')
+    if 'status' in item:
+        fields['embeddable'] = item['status'].get('embeddable', False)
+    if 'snippet' in item:
+        snippet = item['snippet']
+        fields['title'] = snippet.get('title', 'Unknown Title')
+        fields['channel'] = snippet.get('channelTitle', 'Unknown Channel')
+        fields['thumbnail'] = snippet.get('thumbnails', {}).get('medium', {}).get('url', '')
+    return fields
+
+
+def item_from_fields(video_id, fields, parts):
+    """Rebuild a videos.list-shaped item from cached fields"""
+    item = {'id': video_id}
+    if 'contentDetails' in parts:
+        item['contentDetails'] = {'duration': fields['duration']}
+    if 'status' in parts:
+        item['status'] = {'embeddable': fields['embeddable']}
+    if 'snippet' in parts:
+        item['snippet'] = {
+            'title': fields['title'],
+            'channelTitle': fields['channel'],
+            'thumbnails': {'medium': {'url': fields['thumbnail']}} if fields['thumbnail'] else {}
+        }
+    return item
+
+
+class VideoCache:
+    """Per-video metadata cache: in-process LRU in front of a shared SQLite file
+
+    The SQLite file is shared by every gunicorn worker on the box, so a video
+    looked up by one worker is a hit for the others.
+    """
+
+    def __init__(self, db_path, max_memory_items=5000, ttls=None, max_videos=50000):
+        self.db_path = db_path
+        self.max_memory_items = max_memory_items
+        self.max_videos = max_videos
+        self.ttls = dict(DEFAULT_TTLS)
+        self.ttls.update(ttls or {})
+        self._memory = OrderedDict()  # video_id -> {field: (value, fetched_at)}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._init_db()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS video_fields (
+                    video_id TEXT NOT NULL,
+                    field TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    PRIMARY KEY (video_id, field)
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS video_fields_fetched_at ON video_fields (fetched_at)')
+
+    def _is_fresh(self, field, fetched_at, now):
+        ttl = self.ttls.get(field)
+        return ttl is None or now - fetched_at < ttl
+
+    def _remember(self, video_id, entries):
+        """Merge entries into the LRU and evict the oldest videos if over size"""
+        with self._lock:
+            cached = self._memory.pop(video_id, {})
+            cached.update(entries)
+            self._memory[video_id] = cached
+            while len(self._memory) > self.max_memory_items:
+                self._memory.popitem(last=False)
+
+    def get_many(self, video_ids, fields):
+        """Return {video_id: {field: value}} for videos with every requested field fresh"""
+        now = time.time()
+        found = {}
+        missing = []
+
+        with self._lock:
+            for video_id in video_ids:
+                cached = self._memory.get(video_id)
+                if cached and all(f in cached and self._is_fresh(f, cached[f][1], now) for f in fields):
+                    self._memory.move_to_end(video_id)
+                    found[video_id] = {f: cached[f][0] for f in fields}
+                else:
+                    missing.append(video_id)
+
+        if not missing:
+            return found
+
+        # Fall back to the shared on-disk store
+        try:
+            conn = self._connect()
+            for start in range(0, len(missing), 500):
+                batch = missing[start:start + 500]
+                rows = conn.execute(
+                    'SELECT video_id, field, value, fetched_at FROM video_fields WHERE video_id IN (%s)'
+                    % ','.join('?' * len(batch)), batch).fetchall()
+                on_disk = {}
+                for video_id, field, value, fetched_at in rows:
+                    on_disk.setdefault(video_id, {})[field] = (json.loads(value), fetched_at)
+                for video_id, entries in on_disk.items():
+                    self._remember(video_id, entries)
+                    if all(f in entries and self._is_fresh(f, entries[f][1], now) for f in fields):
+                        found[video_id] = {f: entries[f][0] for f in fields}
+        except sqlite3.Error as e:
+            logger.warning("Video cache read failed: %s", e)
+
+        return found
+
+    def get(self, video_id, fields):
+        """Return {field: value} for one video, or None if any field is missing or stale"""
+        return self.get_many([video_id], fields).get(video_id)
+
+    def set_many(self, fields_by_id):
+        """Store {video_id: {field: value}} in memory and on disk"""
+        now = time.time()
+        rows = []
+        for video_id, fields in fields_by_id.items():
+            if not fields:
+                continue
+            self._remember(video_id, {f: (v, now) for f, v in fields.items()})
+            rows.extend((video_id, f, json.dumps(v), now) for f, v in fields.items())
+
+        if not rows:
+            return
+        try:
+            with self._connect() as conn:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO video_fields (video_id, field, value, fetched_at) VALUES (?, ?, ?, ?)',
+                    rows)
+                self._evict_shared(conn, now)
+        except sqlite3.Error as e:
+            logger.warning("Video cache write failed: %s", e)
+
+    def _evict_shared(self, conn, now):
+        """Drop rows past their field's TTL, then every video beyond the max_videos most recently fetched"""
+        conn.executemany('DELETE FROM video_fields WHERE field = ? AND fetched_at < ?',
+                         [(field, now - ttl) for field, ttl in self.ttls.items() if ttl is not None])
+        conn.execute('''
+            DELETE FROM video_fields WHERE video_id IN (
+                SELECT video_id FROM video_fields GROUP BY video_id ORDER BY MAX(fetched_at) DESC LIMIT -1 OFFSET ?
+            )
+        ''', (self.max_videos,))
+
+    def set(self, video_id, **fields):
+        """Store fields for one video"""
+        self.set_many({video_id: fields})
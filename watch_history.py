@@ -0,0 +1,178 @@
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from itertools import islice
+
+from singleflight import file_lock
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILE = 'default'
+
+
+class WatchHistory:
+    """Bounded, per-profile watch history kept in memory and persisted as an append-only log
+
+    Each profile is an OrderedDict keyed by video ID, oldest first, so
+    re-watching a video (move to the front), removing it and evicting the
+    oldest entry past `limit` are all O(1). Every change is one JSON line
+    appended to the log; once the log holds `compact_ratio` times more lines
+    than live entries it is rewritten with just the live ones.
+
+    Workers share the log: before each read a worker replays whatever other
+    processes appended since its last look (one stat() when nothing changed),
+    and a compaction by another worker (a new file) triggers a full reload.
+    """
+
+    def __init__(self, path, limit=50, compact_ratio=4):
+        self.path = path
+        self.limit = limit
+        self.compact_ratio = compact_ratio
+        self.lock_dir = path + '.locks'
+        self._lock = threading.Lock()
+        self._profiles = {}  # profile -> OrderedDict of video_id -> item, oldest first
+        self._file = None  # the log we replayed, kept open
+        self._file_id = None  # its (inode, device)
+        self._offset = 0  # bytes of it replayed so far
+        self._lines = 0  # records in the log, live or not
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    # Replaying the log
+
+    def _apply(self, record):
+        profile = record.get('profile', DEFAULT_PROFILE)
+        op = record.get('op')
+        if op == 'add':
+            history = self._profiles.setdefault(profile, OrderedDict())
+            item = record['item']
+            history.pop(item['id'], None)
+            history[item['id']] = item
+            while len(history) > self.limit:
+                history.popitem(last=False)
+        elif op == 'remove':
+            self._profiles.get(profile, {}).pop(record['id'], None)
+        elif op == 'clear':
+            self._profiles.pop(profile, None)
+
+    def _reset(self, log_file=None):
+        if self._file is not None:
+            self._file.close()
+        self._file = log_file
+        if log_file is not None:
+            stat = os.fstat(log_file.fileno())
+            self._file_id = (stat.st_ino, stat.st_dev)
+        else:
+            self._file_id = None
+        self._profiles, self._offset, self._lines = {}, 0, 0
+
+    def _catch_up(self):
+        """Replay records appended since we last looked (call with self._lock held)"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._reset()
+            return
+
+        if (stat.st_ino, stat.st_dev) != self._file_id:
+            # First look, or another worker compacted the log. Keeping the file open means
+            # its inode can't be reused by a later compaction while we still know it.
+            self._reset(open(self.path, 'rb'))
+        elif stat.st_size == self._offset:
+            return
+
+        self._file.seek(self._offset)
+        data = self._file.read()
+        # Only whole lines; a partly written one is picked up next time
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            try:
+                self._apply(json.loads(line))
+            except (ValueError, KeyError) as e:
+                logger.warning("Skipping bad watch history record: %s", e)
+            self._lines += 1
+        self._offset += end
+
+    # Writing
+
+    def _append(self, records):
+        """Apply records and append them to the log, compacting it when it has grown too long"""
+        data = ''.join(json.dumps(record) + '\n' for record in records).encode('utf-8')
+        with self._lock, file_lock(self.lock_dir, 'watch_history'):
+            self._catch_up()
+            with open(self.path, 'ab') as f:
+                f.write(data)
+            self._catch_up()
+
+            live = sum(len(history) for history in self._profiles.values())
+            if self._lines > self.compact_ratio * max(live, self.limit):
+                self._compact()
+
+    def _compact(self):
+        """Rewrite the log with only the live entries (call holding both locks)"""
+        temp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w') as f:
+            for profile, history in self._profiles.items():
+                for item in history.values():
+                    f.write(json.dumps({'op': 'add', 'profile': profile, 'item': item}) + '\n')
+        os.replace(temp_path, self.path)
+        logger.debug("🗜️ Compacted watch history log from %d records", self._lines)
+        self._catch_up()
+
+    def seed(self, histories):
+        """Import existing history, {profile: items} most recent first, if the log doesn't exist yet"""
+        imported = 0
+        with file_lock(self.lock_dir, 'watch_history'):
+            if os.path.exists(self.path):
+                return False
+            with open(self.path, 'a') as f:
+                for profile, items in histories.items():
+                    for item in reversed(items[:self.limit]):
+                        f.write(json.dumps({'op': 'add', 'profile': profile, 'item': item}) + '\n')
+                        imported += 1
+        if imported:
+            logger.info("📦 Imported %d watch history items for %d profiles into %s",
+                        imported, len(histories), self.path)
+        return True
+
+    def add(self, item, profile=DEFAULT_PROFILE):
+        """Put a video at the front of the profile's history (replacing any older entry)"""
+        self.add_many([(profile, item)])
+
+    def add_many(self, entries):
+        """add() each (profile, item) in order, with a single write to the log"""
+        self._append([{'op': 'add', 'profile': profile, 'item': item} for profile, item in entries])
+
+    def remove(self, video_id, profile=DEFAULT_PROFILE):
+        """Remove one video from the profile's history"""
+        self._append([{'op': 'remove', 'profile': profile, 'id': video_id}])
+
+    def clear(self, profile=DEFAULT_PROFILE):
+        """Remove all of the profile's history"""
+        self._append([{'op': 'clear', 'profile': profile}])
+
+    # Reading
+
+    def get(self, profile=DEFAULT_PROFILE, limit=None):
+        """The profile's history, most recent first"""
+        with self._lock:
+            self._catch_up()
+            history = self._profiles.get(profile)
+            if not history:
+                return []
+            return list(islice(reversed(history.values()), limit))
+
+    def count(self, profile=DEFAULT_PROFILE):
+        with self._lock:
+            self._catch_up()
+            return len(self._profiles.get(profile, ()))
+
+    def version(self):
+        """Token that changes whenever the history changes, in any worker"""
+        with self._lock:
+            self._catch_up()
+            return self._file_id, self._offset
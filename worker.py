@@ -0,0 +1,18 @@
+"""Prefetch worker: keeps favorited playlists and channels precomputed
+
+Run it as its own process (the `worker` entry in the Procfile) and set
+PREFETCH_IN_PROCESS=0 on the web process so the work isn't done twice.
+"""
+import logging
+import os
+
+# This process runs the warm loop on its main thread; don't let importing app start another
+os.environ['PREFETCH_IN_PROCESS'] = '0'
+
+from app import PREFETCH_INTERVAL, run_prefetch_worker  # noqa: E402
+
+logger = logging.getLogger('worker')
+
+if __name__ == '__main__':
+    logger.info("🔥 Prefetch worker warming favorites every %.0fs", PREFETCH_INTERVAL)
+    run_prefetch_worker(PREFETCH_INTERVAL)